@@ -0,0 +1,161 @@
+import time
+
+
+class DancingLinks:
+    # Knuth's Algorithm X on dancing links. rows are sequences of column
+    # indices in range(columns), a solution is a set of rows that covers
+    # every column exactly once.
+    def __init__(self, rows, columns):
+        # node 0 is the root, nodes 1..columns are the column headers
+        n = columns + 1
+        self.L = [n - 1] + list(range(n - 1))
+        self.R = list(range(1, n)) + [0]
+        self.U = list(range(n))
+        self.D = list(range(n))
+        self.C = list(range(n))
+        self.S = [0] * n
+        self.rows = [-1] * n
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        for r, cols in enumerate(rows):
+            first = None
+            for c in cols:
+                c = int(c) + 1
+                x = len(C)
+                C.append(c)
+                self.rows.append(r)
+                U.append(U[c])
+                D.append(c)
+                D[U[c]] = x
+                U[c] = x
+                S[c] += 1
+                if first is None:
+                    first = x
+                    L.append(x)
+                    R.append(x)
+                else:
+                    L.append(L[first])
+                    R.append(first)
+                    R[L[first]] = x
+                    L[first] = x
+        self.status = None
+        self.nodes = 0
+
+    def _cover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                D[U[j]] = D[j]
+                U[D[j]] = U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def _uncover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = j
+                U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    def _select(self, x):
+        # cover the other columns of the row of node x
+        R, C = self.R, self.C
+        j = R[x]
+        while j != x:
+            self._cover(C[j])
+            j = R[j]
+
+    def _deselect(self, x):
+        L, C = self.L, self.C
+        j = L[x]
+        while j != x:
+            self._uncover(C[j])
+            j = L[j]
+
+    def _choose(self):
+        # the column with the fewest rows left
+        R, S = self.R, self.S
+        c = best = R[0]
+        size = S[c]
+        while c and size > 1:
+            if S[c] < size:
+                best, size = c, S[c]
+            c = R[c]
+        return best
+
+    def iter_solutions(self, limit=None, timeout=None):
+        # yields every solution as a list of row indices, status ends as SAT,
+        # UNSAT or UNKNOWN when the time runs out first
+        R, D, C, S = self.R, self.D, self.C, self.S
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        check = 1024
+        stack = []
+        found = 0
+        forward = True
+        self.status = 'UNKNOWN'
+        self.nodes = 0
+        try:
+            while True:
+                if forward:
+                    if R[0] == 0:
+                        found += 1
+                        self.status = 'SAT'
+                        yield [self.rows[x] for x in stack]
+                        if limit is not None and found >= limit:
+                            break
+                        forward = False
+                        continue
+                    c = self._choose()
+                    if S[c] == 0:
+                        forward = False
+                        continue
+                    self._cover(c)
+                    stack.append(D[c])
+                    self._select(D[c])
+                    self.nodes += 1
+                    if deadline is not None and self.nodes >= check:
+                        if time.perf_counter() > deadline:
+                            return
+                        check = self.nodes + 1024
+                else:
+                    if not stack:
+                        break
+                    x = stack.pop()
+                    self._deselect(x)
+                    c = C[x]
+                    x = D[x]
+                    if x == c:
+                        self._uncover(c)
+                    else:
+                        stack.append(x)
+                        self._select(x)
+                        self.nodes += 1
+                        forward = True
+            if not found:
+                self.status = 'UNSAT'
+        finally:
+            # leave the links as they were for the next search
+            while stack:
+                x = stack.pop()
+                self._deselect(x)
+                self._uncover(C[x])
+
+    def solve(self, timeout=None):
+        solutions = self.iter_solutions(1, timeout)
+        rows = next(solutions, None)
+        solutions.close()
+        return rows
+
+    def count_solutions(self, limit=None, timeout=None):
+        return sum(1 for _ in self.iter_solutions(limit, timeout))
@@ -22,6 +22,7 @@ from ipywidgets import IntSlider, VBox, HBox, Layout, Dropdown, Button, Text, La
 import ipycanvas
 from ipycanvas import Canvas
 from ipyevents import Event
+from exact_cover import DancingLinks
 
 BlocksColor = [
     "#ffb631",
@@ -205,7 +206,9 @@ class Target:
         for key, val in self.cube_variables.items():
             self.clauses.extend(exact_one(list(val.values())))
 
-    def solve(self, block_names_: Optional[str] = None):
+    def solve(
+        self, block_names_: Optional[str] = None, engine: Literal["sat", "dlx"] = "sat"
+    ):
         if block_names_ is None:
             block_names = BlockNames
         else:
@@ -219,11 +222,15 @@ class Target:
 
         all_block_ids = [block.id for block in blocks]
 
-        variables = count(1, 1)
-
         for block in blocks:
             block.place(self)
 
+        if engine == "dlx":
+            self.solve_exact_cover(blocks)
+            return
+
+        variables = count(1, 1)
+
         self.create_variables(blocks, variables)
         for block in blocks:
             block.create_variables(variables)
@@ -246,6 +253,24 @@ class Target:
                     self.solution[bid].append(cube)
             self.solution = dict(self.solution)
 
+    def solve_exact_cover(self, blocks):
+        # one column per cube and one per block, a row is a placed block
+        cubes = {cube: i for i, cube in enumerate(sorted(self.cubes_set))}
+        rows = []
+        placements = []
+        for i, block in enumerate(blocks):
+            for placed_block in block.placed_blocks:
+                rows.append([cubes[cube] for cube in placed_block] + [len(cubes) + i])
+                placements.append((block.id, placed_block))
+
+        self.dlx = DancingLinks(rows, len(cubes) + len(blocks))
+        solution = self.dlx.solve()
+        self.solution = {}
+        if solution is not None:
+            for row in solution:
+                bid, placed_block = placements[row]
+                self.solution[bid] = list(placed_block)
+
 
 class BoxScene:
     def __init__(self):
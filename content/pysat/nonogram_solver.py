@@ -1,21 +1,123 @@
-from bs4 import BeautifulSoup
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
 import itertools
 from itertools import count
+from html.parser import HTMLParser
 import numpy as np
-from pysat.solvers import Solver
 import ipycanvas
 from ipycanvas import Canvas
 import ipywidgets as ipw
+from sathelp import SATHelper, worker_pool
 
+try:
+    import sqlite3
+except ImportError:
+    # not every Pyodide build ships sqlite3
+    sqlite3 = None
 
-def read_table_content(table):
-    data = []
-    rows = table.find_all('tr')
-    for row in rows:
-        cols = row.find_all('td')
-        cols = [ele.text.strip() for ele in cols]
-        data.append([ele for ele in cols]) 
-    return data
+SOLUTION_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nonogram_solutions.sqlite')
+
+
+class ClueParser(HTMLParser):
+    # collects the cell texts of the nmtt (top) and nmtl (left) clue tables
+    # of a nonograms.org page, one list of strings per table row
+    SECTIONS = ('nmtt', 'nmtl')
+
+    def __init__(self):
+        super().__init__()
+        self.tables = {}
+        self.section = None
+        self.depth = 0
+        self.text = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'td' and tag != 'tr':
+            return
+        if self.section is None:
+            if tag == 'td':
+                classes = (dict(attrs).get('class') or '').split()
+                for name in self.SECTIONS:
+                    if name in classes:
+                        self.section = name
+                        self.depth = 0
+                        self.tables[name] = []
+            return
+        if tag == 'tr':
+            self.tables[self.section].append([])
+        else:
+            self.depth += 1
+            self.text = []
+
+    def handle_endtag(self, tag):
+        if self.section is None or tag != 'td':
+            return
+        if self.depth == 0:
+            self.section = None
+        else:
+            self.depth -= 1
+            self.tables[self.section][-1].append(''.join(self.text).strip())
+            self.text = None
+
+    def handle_data(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+    def done(self):
+        return self.section is None and len(self.tables) == len(self.SECTIONS)
+
+
+def parse_html_clues(html, chunk_size=4096):
+    # stops reading once both clue tables are complete, the solution grid
+    # after them is most of the page
+    parser = ClueParser()
+    for i in range(0, len(html), chunk_size):
+        parser.feed(html[i:i + chunk_size])
+        if parser.done():
+            break
+    if not parser.done():
+        raise ValueError('no nmtt and nmtl clue tables found')
+    top = parser.tables['nmtt']
+    left = parser.tables['nmtl']
+    cols = [[int(v) for v in line if v] for line in zip(*top)]
+    rows = [[int(v) for v in line if v] for line in left]
+    return rows, cols
+
+def parse_text_clues(text):
+    # rows, an empty line, then columns, one clue per line with the numbers
+    # separated by spaces or commas, 0 for an empty line
+    blocks = re.split(r'\n\s*\n', text.strip())
+    if len(blocks) != 2:
+        raise ValueError('expected a block of rows and a block of columns')
+    rows, cols = [[[int(v) for v in re.split(r'[\s,]+', line.strip()) if v and v != '0']
+                   for line in block.splitlines()] for block in blocks]
+    return rows, cols
+
+def parse_clues(text):
+    # HTML of a nonograms.org puzzle, JSON {"rows": ..., "cols": ...} or text
+    stripped = text.lstrip()
+    if stripped.startswith('<'):
+        return parse_html_clues(text)
+    if stripped.startswith('{'):
+        data = json.loads(text)
+        return data['rows'], data['cols']
+    return parse_text_clues(text)
+
+def load_clues(fn):
+    with open(fn, encoding='utf-8') as f:
+        return parse_clues(f.read())
+
+def load_clue_dir(path):
+    # yields (file name, rows, cols) for every file of a directory
+    for name in sorted(os.listdir(path)):
+        fn = os.path.join(path, name)
+        if os.path.isfile(fn):
+            rows, cols = load_clues(fn)
+            yield name, rows, cols
 
 def dnf_to_cnf(dnf, new_vars=None):
     if new_vars is None:
@@ -45,10 +147,12 @@ def end_pos(numbers, count):
     for pos in start_pos(numbers, count):
         yield start + pos
         
-def create_position_variables(numbers, count, new_bool_variables):
+def create_position_variables(numbers, count, new_bool_variables, starts=None):
+    # starts limits every number to the given positions
     pos_variables = []
     for i, (a, b) in enumerate(zip(start_pos(numbers, count), end_pos(numbers, count))):
-        pos_variables.append({j:next(new_bool_variables) for j in range(a, b + 1)})
+        positions = range(a, b + 1) if starts is None else starts[i]
+        pos_variables.append({j:next(new_bool_variables) for j in positions})
     return pos_variables
 
 
@@ -102,9 +206,195 @@ def cell_variables_constraint(pos_variables, cell_variables, numbers, count):
                     cnf.append([-pos_var1[pos1], -pos_var2[pos2], -cell_variables[j]])
     return cnf
 
+def automaton_constraint(numbers, cell_variables, new_bool_variables):
+    # the line as a word of 0* 1^n1 0+ 1^n2 ... 0*, state q of the automaton
+    # has read q symbols of 1^n1 0 1^n2 ..., states[t][q] is true when it is
+    # in state q after t cells
+    numbers = [v for v in numbers if v]
+    count = len(cell_variables)
+    pattern = []
+    for n in numbers:
+        pattern += [1] * n + [0]
+    pattern = pattern[:-1]
+    final = len(pattern)
+    if final > count:
+        return [[]]
+
+    def step(q, c):
+        if q < final and pattern[q] == c:
+            return q + 1
+        if c == 0 and (q == 0 or q == final or pattern[q - 1] == 0):
+            return q
+        return None
+
+    # only the states that can be reached from the start and still reach the end
+    states = [{q: next(new_bool_variables) for q in range(max(0, final - count + t), min(t, final) + 1)}
+              for t in range(count + 1)]
+    cnf = [[states[0][0]], [states[count][final]]]
+    for t, x in enumerate(cell_variables):
+        current, following = states[t], states[t + 1]
+        for q, s in current.items():
+            successors = []
+            for c, lit in ((1, x), (0, -x)):
+                v = following.get(step(q, c))
+                if v is None:
+                    cnf.append([-s, -lit])
+                else:
+                    cnf.append([-s, -lit, v])
+                    successors.append(v)
+            cnf.append([-s] + successors)
+        # every state is entered from the state before
+        for q, s in following.items():
+            for c, lit in ((1, x), (0, -x)):
+                cnf.append([-s, -lit] + [current[p] for p in (q - 1, q) if p in current and step(p, c) == q])
+    return cnf
+
+def position_encoding_size(numbers, positions):
+    # rough clause count of the position variable encoding
+    size = 0
+    for i, n in enumerate(numbers):
+        size += positions[i] * (positions[i] - 1) // 2 + n * positions[i]
+        if i > 0:
+            p = positions[i - 1] * positions[i]
+            size += p + p * max(positions[i - 1], positions[i]) // 3
+    return size
+
+def automaton_encoding_size(numbers, count):
+    states = (count + 1) * (count - sum(numbers) - len(numbers) + 2)
+    return 7 * states
+
+def line_encoding(numbers, count, starts=None):
+    # the smaller of the two encodings for a line
+    numbers = [v for v in numbers if v]
+    if not numbers:
+        return 'automaton'
+    if starts is None:
+        positions = [count - sum(numbers) - len(numbers) + 2] * len(numbers)
+    else:
+        positions = [len(block) for block in starts]
+    if position_encoding_size(numbers, positions) <= automaton_encoding_size(numbers, count):
+        return 'position'
+    return 'automaton'
+
+
+def clue_array(clues):
+    # one row of block lengths per line, padded with zeros
+    clues = [[v for v in clue if v] for clue in clues]
+    array = np.zeros((len(clues), max(map(len, clues), default=0)), dtype=int)
+    for i, clue in enumerate(clues):
+        array[i, :len(clue)] = clue
+    return array
+
+def reverse_clues(clues):
+    k = (clues > 0).sum(axis=1)
+    index = k[:, None] - 1 - np.arange(clues.shape[1])
+    return np.where(index >= 0, np.take_along_axis(clues, np.maximum(index, 0), axis=1), 0)
+
+def line_prefixes(clues, lines):
+    # fits[k, l, i]: the first k blocks of line l fit in its first i cells,
+    # cells are 1 filled, 0 empty or -1 unknown, all lines have one length
+    count, n = lines.shape
+    index = np.arange(n + 1)
+    zero = np.zeros((count, 1), dtype=int)
+    filled = np.hstack([zero, np.cumsum(lines == 1, axis=1)])
+    blocked = np.hstack([zero, np.cumsum(lines == 0, axis=1)])
+    # the last filled cell before i, the cells after the end of a block and
+    # up to i must be empty
+    last_filled = np.maximum.accumulate(
+        np.where(np.hstack([zero > 0, lines == 1]), index - 1, -1), axis=1)
+    # cell i - 1 can be empty
+    empty_before = np.hstack([zero > 0, lines != 1])
+    fits = [filled == 0]
+    for k in range(clues.shape[1]):
+        b = clues[:, k:k + 1]
+        start = np.maximum(index - b, 0)
+        ends = (index >= b) & (np.take_along_axis(blocked, start, axis=1) == blocked)
+        if k == 0:
+            ends &= np.take_along_axis(fits[0], start, axis=1)
+        else:
+            # a gap before the block and k blocks before the gap
+            gap = np.hstack([zero > 0, fits[k][:, :-1]]) & empty_before
+            ends &= np.take_along_axis(gap, start, axis=1)
+        last_end = np.maximum.accumulate(np.where(ends, index, -1), axis=1)
+        fits.append(np.where(b > 0, last_end > last_filled, fits[k]))
+    return np.array(fits)
+
+def block_starts(clues, lines):
+    # starts[i][l, s]: block i of line l can start at cell s in a placement
+    # of all the blocks, also returns where the cells can be empty and which
+    # lines have a placement at all
+    count, n = lines.shape
+    rows = np.arange(count)
+    k = (clues > 0).sum(axis=1)
+    head = line_prefixes(clues, lines)
+    # tail[j, l, i]: the blocks of line l from j on fit in its cells from i on
+    rev = line_prefixes(reverse_clues(clues), lines[:, ::-1])
+    j = np.arange(clues.shape[1] + 1)[:, None]
+    tail = rev[np.maximum(k - j, 0), rows][:, :, ::-1]
+
+    can_empty = (head[:, :, :n] & tail[:, :, 1:]).any(axis=0) & (lines != 1)
+    result = []
+    s = np.arange(n)
+    blocked = np.hstack([np.zeros((count, 1), dtype=int), np.cumsum(lines == 0, axis=1)])
+    not_filled = np.hstack([lines != 1, np.zeros((count, 1), dtype=bool)])
+    for i in range(clues.shape[1]):
+        b = clues[:, i:i + 1]
+        e = np.minimum(s + b, n)
+        starts = (b > 0) & (s + b <= n) & (np.take_along_axis(blocked, e, axis=1) == blocked[:, :n])
+        if i == 0:
+            starts &= head[0, :, :n]
+        else:
+            before = np.maximum(s - 1, 0)
+            starts &= (s > 0) & head[i][:, before] & not_filled[:, before]
+        last = tail[i + 1][rows[:, None], e]
+        after = tail[i + 1][rows[:, None], np.minimum(e + 1, n)] & (e < n) & \
+                np.take_along_axis(not_filled, e, axis=1)
+        starts &= np.where(k[:, None] == i + 1, last, after)
+        result.append(starts)
+    return result, can_empty, head[-1, :, n]
+
+def solve_lines(clues, lines):
+    # the cells that are the same in every placement of the blocks
+    count, n = lines.shape
+    starts, can_empty, ok = block_starts(clues, lines)
+    can_fill = np.zeros((count, n), dtype=bool)
+    s = np.arange(n)
+    for b, block in zip(clues.T, starts):
+        b = b[:, None]
+        cover = np.hstack([np.zeros((count, 1), dtype=int), np.cumsum(block, axis=1)])
+        first = np.maximum(s - b + 1, 0)
+        can_fill |= cover[:, 1:] > np.take_along_axis(cover, first, axis=1)
+    return np.where(can_fill & can_empty, -1, can_fill).astype(lines.dtype), ok
+
+def solve_line(numbers, line):
+    # None if the blocks do not fit
+    lines, ok = solve_lines(clue_array([numbers]), np.asarray(line)[None])
+    if ok[0]:
+        return lines[0]
+
+def line_solve(rows, cols, grid=None):
+    # runs the line solver over the rows and columns until nothing changes,
+    # returns the grid with -1 for undecided cells or None on a contradiction
+    if grid is None:
+        grid = np.full((len(rows), len(cols)), -1, dtype=np.int8)
+    clues = [clue_array(rows), clue_array(cols)]
+    lines = [grid, grid.T]
+    dirty = [np.ones(len(rows), dtype=bool), np.ones(len(cols), dtype=bool)]
+    axis = 0
+    while dirty[axis].any():
+        index = np.where(dirty[axis])[0]
+        new, ok = solve_lines(clues[axis][index], lines[axis][index])
+        if not ok.all():
+            return None
+        dirty[1 - axis] |= (new != lines[axis][index]).any(axis=0)
+        lines[axis][index] = new
+        dirty[axis][:] = False
+        axis = 1 - axis
+    return grid
+
 
 class NonogramSolver:
-    def __init__(self, rows, cols, width=None, height=None):
+    def __init__(self, rows, cols, width=None, height=None, presolve=False, propagate=True, encoding=None):
         if width is None:
             width = len(cols)
         if height is None:
@@ -114,32 +404,221 @@ class NonogramSolver:
         self.width = width
         self.height = height
         self.var_count = self.width * self.height
-        self.vars = np.arange(1, self.var_count + 1).reshape(-1, self.width)
-        self.new_vars = itertools.count(self.var_count + 2)
-            
-    def add_constraints(self, numbers, count, cell_variables):
-        pos_variables = create_position_variables(numbers, count, self.new_vars)
-        self.cnf.extend(position_variables_constraint(pos_variables, numbers))
-        self.cnf.extend(cell_variables_constraint(pos_variables, cell_variables, numbers, count))       
-        
-    def solve(self):
-        self.cnf = []
+        self.presolve = presolve
+        self.propagate = propagate
+        # 'position', 'automaton' or None to choose per line
+        self.encoding = encoding
         self.solution = None
+
+    def add_constraints(self, numbers, count, cell_variables, line=None):
+        starts = None
+        if line is not None:
+            # only the positions left by the line solver
+            blocks, _, _ = block_starts(clue_array([numbers]), line[None])
+            starts = [np.where(block[0])[0].tolist() for block in blocks]
+        encoding = self.encoding
+        if encoding is None:
+            encoding = line_encoding(numbers, count, starts)
+        sat = self.sat
+        with sat.tagged(encoding):
+            if encoding == 'automaton':
+                sat.extend(automaton_constraint(numbers, cell_variables, sat))
+                return
+            pos_variables = create_position_variables(numbers, count, sat, starts)
+            sat.extend(position_variables_constraint(pos_variables, numbers))
+            sat.extend(cell_variables_constraint(pos_variables, cell_variables, numbers, count))
+
+    def solve(self, processes=None):
+        self.solution = None
+        # the line solver decides most cells, only the rest is left to SAT
+        self.grid = None
+        if self.propagate:
+            self.grid = line_solve(self.rows, self.cols)
+            if self.grid is None:
+                return
+            if (self.grid >= 0).all():
+                self.solution = self.grid.astype(int)
+                return
+
+        self.sat = sat = SATHelper(presolve=self.presolve, keep_cnfs=processes is not None)
+        self.vars = sat.block('cell', (self.height, self.width))
+        # lines decided by the line solver already match their clues
+        undecided = np.ones((self.height, self.width), dtype=bool) if self.grid is None else self.grid < 0
         try:
             for i, row in enumerate(self.rows):
-                self.add_constraints(row, self.width, self.vars[i, :].tolist())
+                if undecided[i, :].any():
+                    line = None if self.grid is None else self.grid[i, :]
+                    self.add_constraints(row, self.width, self.vars[i, :].tolist(), line)
                 
             for j, col in enumerate(self.cols):
-                self.add_constraints(col, self.height, self.vars[:, j].tolist())
+                if undecided[:, j].any():
+                    line = None if self.grid is None else self.grid[:, j]
+                    self.add_constraints(col, self.height, self.vars[:, j].tolist(), line)
         except:
             return
 
-        sat = Solver()
-        sat.append_formula(self.cnf)
-        sat.solve()
-        res = sat.get_model()
-        self.solution = np.array(res[:self.var_count]).reshape(self.height, -1)
-        self.solution[self.solution == -1] = 0 
+        self.assumptions = assumptions = []
+        if self.grid is not None:
+            decided = self.grid >= 0
+            self.assumptions = assumptions = np.where(self.grid == 1, self.vars, -self.vars)[decided].tolist()
+        if processes is None:
+            res = sat.solve(assumptions)
+        else:
+            # split on the undecided cells of the middle row
+            middle = self.height // 2
+            split_on = self.vars[middle] if self.grid is None else self.vars[middle][self.grid[middle] < 0]
+            res = sat.solve_cubes(split_on=split_on, assumptions=assumptions, processes=processes)
+        if res is not None:
+            self.solution = sat.decode(res, 'cell').astype(int)
+
+    def analyze(self, batch_size=16):
+        # whether the solution is unique, and the forced cells (the backbone)
+        # as a grid with -1 for cells that differ between solutions
+        if self.solution is None:
+            self.solve()
+        self.unique = False
+        self.forced = None
+        if self.solution is None:
+            return self.unique, self.forced
+        self.forced = self.solution.astype(np.int8)
+        if self.grid is not None and (self.grid >= 0).all():
+            # the line solver only makes forced deductions
+            self.unique = True
+            return self.unique, self.forced
+
+        sat = self.sat
+        undecided = np.ones(self.solution.shape, dtype=bool) if self.grid is None else self.grid < 0
+        # literals of the first solution that might still flip
+        literals = np.where(self.solution > 0, self.vars, -self.vars)
+        candidates = literals[undecided].tolist()
+        forced = []
+        # the first batch holds every cell, that is the uniqueness check
+        size = len(candidates)
+        while candidates:
+            batch = candidates[:size]
+            # can any cell of the batch take the other value
+            sat.push()
+            sat.extend([[-v for v in batch]])
+            model = sat.solve(self.assumptions)
+            sat.pop()
+            if model is None:
+                forced += batch
+                candidates = candidates[size:]
+                size *= 2
+            else:
+                # the cells that flipped in this solution are not forced
+                values = np.asarray(model)
+                candidates = [v for v in candidates if values[abs(v) - 1] == v]
+                size = max(min(size // 2, batch_size), 1)
+        self.unique = bool(len(forced) == undecided.sum())
+        self.forced[undecided & ~np.isin(literals, forced)] = -1
+        return self.unique, self.forced
+
+def clue_key(rows, cols):
+    # the same for every way of writing the same clues
+    text = '/'.join(';'.join(' '.join([str(int(v)) for v in line if v]) for line in lines)
+                    for lines in (rows, cols))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def format_solution(solution):
+    return '' if solution is None else ''.join(map(str, solution.ravel().tolist()))
+
+def parse_solution(text, height):
+    # '' is an unsolvable puzzle
+    if text:
+        return (np.frombuffer(text.encode(), dtype=np.uint8) - ord('0')).reshape(height, -1)
+
+
+class SolutionCache:
+    # solutions by clue key in an sqlite file, in memory when sqlite or the
+    # file is not available
+    def __init__(self, fn):
+        self.fn = fn
+        self.db = None
+        self.solutions = {}
+
+    def connect(self):
+        if self.db is None:
+            self.db = False
+            if sqlite3 is not None:
+                try:
+                    db = sqlite3.connect(self.fn)
+                    db.execute('CREATE TABLE IF NOT EXISTS solutions (key TEXT PRIMARY KEY, solution TEXT)')
+                    self.db = db
+                except sqlite3.Error:
+                    pass
+        return self.db
+
+    def get_many(self, keys):
+        found = {key: self.solutions[key] for key in keys if key in self.solutions}
+        db = self.connect()
+        missing = [key for key in keys if key not in found]
+        if db and missing:
+            for i in range(0, len(missing), 500):
+                part = missing[i:i + 500]
+                query = 'SELECT key, solution FROM solutions WHERE key IN ({})'.format(','.join('?' * len(part)))
+                found.update(db.execute(query, part).fetchall())
+            self.solutions.update(found)
+        return found
+
+    def put_many(self, items):
+        items = list(items)
+        self.solutions.update(items)
+        db = self.connect()
+        if db:
+            try:
+                with db:
+                    db.executemany('INSERT OR REPLACE INTO solutions VALUES (?, ?)', items)
+            except sqlite3.Error:
+                pass
+
+
+solution_cache = SolutionCache(SOLUTION_CACHE_FILE)
+
+
+def _solve_clues(clues):
+    rows, cols = clues
+    solver = NonogramSolver(rows, cols)
+    solver.solve()
+    return format_solution(solver.solution)
+
+
+def _analyze_clues(clues):
+    rows, cols = clues
+    solver = NonogramSolver(rows, cols)
+    unique, forced = solver.analyze()
+    if forced is None:
+        return unique, ''
+    return unique, ''.join('-' if v < 0 else str(v) for v in forced.ravel().tolist())
+
+
+def solve_batch(puzzles, processes=None, cache=solution_cache, chunksize=1):
+    # yields the solutions of (rows, cols) clue pairs in input order, None for
+    # unsolvable puzzles, cached solutions are looked up before the misses
+    # are solved on a process pool
+    puzzles = list(puzzles)
+    keys = [clue_key(rows, cols) for rows, cols in puzzles]
+    found = {} if cache is None else cache.get_many(keys)
+    misses = {}
+    for key, clues in zip(keys, puzzles):
+        if key not in found:
+            misses.setdefault(key, clues)
+    if misses:
+        with worker_pool(processes) as pool:
+            solved = list(zip(misses, pool.map(_solve_clues, list(misses.values()), chunksize)))
+        found.update(solved)
+        if cache is not None:
+            cache.put_many(solved)
+    for key, (rows, cols) in zip(keys, puzzles):
+        yield parse_solution(found[key], len(rows))
+
+
+def analyze_batch(puzzles, processes=None, chunksize=1):
+    # (unique, forced cells) for every (rows, cols) clue pair, the forced
+    # cells as a string row by row with - for free cells, '' when unsolvable
+    with worker_pool(processes) as pool:
+        return pool.map(_analyze_clues, list(puzzles), chunksize)
+
 
 class NonogramGui:
     def __init__(self):
@@ -157,12 +636,7 @@ class NonogramGui:
         self.text_area.value = ''
         
     def solve(self, b):
-        html = self.text_area.value
-        soup = BeautifulSoup(html, 'html.parser')
-        table_top = soup.find(class_='nmtt')
-        table_left = soup.find(class_='nmtl')
-        cols = [[int(v) for v in line if v] for line in zip(*read_table_content(table_top))]
-        rows = [[int(v) for v in line if v] for line in read_table_content(table_left)]
+        rows, cols = parse_clues(self.text_area.value)
         self.solver = NonogramSolver(rows, cols)
         self.solver.solve()
         self.draw()
@@ -207,4 +681,40 @@ class NonogramGui:
                 if v:
                     canvas.fill_style = '#777777'
                     canvas.fill_rect(x+0.5, y+0.5, step-1, step-1)
-                
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve nonogram clue files, HTML, JSON or text.')
+    parser.add_argument('paths', nargs='+', help='clue files or directories of clue files')
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    parser.add_argument('--no-cache', action='store_true', help='solve every puzzle again')
+    parser.add_argument('--unique', action='store_true',
+                        help='check uniqueness and print the forced cells instead')
+    args = parser.parse_args(argv)
+
+    names = []
+    puzzles = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            for name, rows, cols in load_clue_dir(path):
+                names.append(os.path.join(path, name))
+                puzzles.append((rows, cols))
+        else:
+            names.append(path)
+            puzzles.append(load_clues(path))
+
+    start = time.perf_counter()
+    if args.unique:
+        for name, (unique, forced) in zip(names, analyze_batch(puzzles, args.processes)):
+            print(name, 'unique' if unique else 'multiple' if forced else 'unsolvable', forced or '-')
+    else:
+        cache = None if args.no_cache else solution_cache
+        for name, solution in zip(names, solve_batch(puzzles, args.processes, cache)):
+            # one line per puzzle, the cells row by row, - when unsolvable
+            print(name, format_solution(solution) or '-')
+    elapsed = time.perf_counter() - start
+    print(f'{len(puzzles)} puzzles in {elapsed:.3f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
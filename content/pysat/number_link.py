@@ -2,26 +2,10 @@ from typing import Tuple
 import numpy as np
 from itertools import product, combinations
 from collections import defaultdict
-from pysat.solvers import Solver
 import ipycanvas
 from ipycanvas import Canvas
 from ipyevents import Event
-
-
-class VariableGenerator:
-    def __init__(self):
-        self.current = 1
-
-    def __next__(self):
-        v = self.current
-        self.current += 1
-        return v
-
-    def get_variables(self, n):
-        n = int(n)
-        variables = list(range(self.current, self.current + n))
-        self.current += n
-        return variables
+from sathelp import SATHelper
 
 
 def dnf_to_cnf(dnf, new_vars):
@@ -85,64 +69,72 @@ def str_to_board(board_str):
 class NumberLinkSolver:
     segments: list[tuple[int]]
 
-    def __init__(self, board_: list[list[int]], max_retry=100):
+    def __init__(self, board_: list[list[int]], max_retry=100, presolve=False):
         self.board = board = np.asarray(board_)
         self.max_retry = max_retry
         height, width = board.shape
         number_count = np.max(board)
 
-        vg = VariableGenerator()
-        cell_variables = np.asarray(vg.get_variables(width * height * number_count)).reshape(
-            height, width, number_count
-        )
+        self.sat = sat = SATHelper(presolve=presolve, keep_cnfs=False)
+        cell_variables = sat.block("cell", (height, width, number_count))
         self.link_variables = link_variables = {}
         for x, y in product(range(width), range(height)):
             x2, y2 = x + 1, y
             x3, y3 = x, y + 1
             if x2 < width:
-                v = next(vg)
+                v = next(sat)
                 link_variables[v] = x, y, x2, y2
             if y3 < height:
-                v = next(vg)
+                v = next(sat)
                 link_variables[v] = x, y, x3, y3
 
         self.link_variables_r = {v: k for k, v in self.link_variables.items()}
+        self.link_array = np.array(list(link_variables.keys()))
+        self.segment_array = np.array(list(link_variables.values())).reshape(-1, 4)
 
         cell_links = defaultdict(list)
         for v, (x0, y0, x1, y1) in link_variables.items():
             cell_links[x0, y0].append(v)
             cell_links[x1, y1].append(v)
 
-        cnfs = []
         # 一つのセルは一つの数字
-        for row in cell_variables.reshape(-1, number_count):
-            cnfs.extend(atmost_one(row.tolist()))
+        with sat.tagged('cell_number'):
+            cnfs = []
+            for row in cell_variables.reshape(-1, number_count):
+                cnfs.extend(atmost_one(row.tolist()))
+            sat.extend(cnfs)
 
         # 数字固定のセル
-        for y, x in zip(*np.where(board > 0)):
-            number = board[y, x]
-            cnfs.append([int(cell_variables[y, x, number - 1])])
+        with sat.tagged('given'):
+            cnfs = []
+            for y, x in zip(*np.where(board > 0)):
+                number = board[y, x]
+                cnfs.append([int(cell_variables[y, x, number - 1])])
+            sat.extend(cnfs)
 
         # 数字なしのセルは二つのリンク(あるいはリンクなし)、数字ありのセルは一つのリンク
-        for (x, y), variables in cell_links.items():
-            if board[y, x] == 0:
-                cnf = exact_n(variables, 2)
-                # cnf = equals_to(variables, [0, 2], vg)
-            else:
-                cnf = exact_n(variables, 1)
-            cnfs.extend(cnf)
+        with sat.tagged('cell_links'):
+            cnfs = []
+            for (x, y), variables in cell_links.items():
+                if board[y, x] == 0:
+                    cnf = exact_n(variables, 2)
+                    # cnf = equals_to(variables, [0, 2], vg)
+                else:
+                    cnf = exact_n(variables, 1)
+                cnfs.extend(cnf)
+            sat.extend(cnfs)
 
         # リンク両端の数字は同じ
-        for var_link, (x1, y1, x2, y2) in link_variables.items():
-            var_link = int(var_link)
-            vars_cell1 = cell_variables[y1, x1].tolist()
-            vars_cell2 = cell_variables[y2, x2].tolist()
-            for c1, c2 in zip(vars_cell1, vars_cell2):
-                cnfs.append([-var_link, c1, -c2])
-                cnfs.append([-var_link, -c1, c2])
-
-        self.solver = solver = Solver()
-        solver.append_formula(cnfs)
+        with sat.tagged('link_number'):
+            cnfs = []
+            for var_link, (x1, y1, x2, y2) in link_variables.items():
+                var_link = int(var_link)
+                vars_cell1 = cell_variables[y1, x1].tolist()
+                vars_cell2 = cell_variables[y2, x2].tolist()
+                for c1, c2 in zip(vars_cell1, vars_cell2):
+                    cnfs.append([-var_link, c1, -c2])
+                    cnfs.append([-var_link, -c1, c2])
+            sat.extend(cnfs)
         self.solve()
 
     def solve(self):
@@ -153,19 +145,14 @@ class NumberLinkSolver:
                 break
             for path in loop_pathes:
                 variables = self.get_path_variables(path)
-                self.solver.append_formula([[-v for v in variables]])
+                self.sat.not_dnf(variables)
 
         self.retry_count = i
 
     def get_segments(self):
-        self.solver.solve()
-        m = self.solver.get_model()
+        m = self.sat.solve()
         if m is not None:
-            segments = []
-            for k, segment in self.link_variables.items():
-                if m[k - 1] > 0:
-                    segments.append(segment)
-            return segments
+            return [tuple(segment) for segment in self.segment_array[self.sat.decode(m, self.link_array)].tolist()]
         else:
             return []
 
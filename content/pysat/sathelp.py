@@ -1,7 +1,83 @@
-from itertools import combinations
+import os
+import json
+import time
+import threading
+import multiprocessing
+from math import comb
+from functools import wraps
+from contextlib import contextmanager
+from itertools import combinations, chain, product
+from collections import defaultdict
+import numpy as np
 from pysat.solvers import Solver
 
+
+def card_encoding(n, k):
+    # "at most k of n": keep the binomial encoding while it is not larger
+    # than the sequential counter (2nk + n - 3k - 1 clauses)
+    if comb(n, k + 1) <= 2 * n * k + n - 3 * k - 1:
+        return 'binomial'
+    return 'seqcounter'
+
+
+PATTERN_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cnf_patterns.json')
+
+
+class JSONCache:
+    # a dict kept in a JSON file, loaded on first use and rewritten whole on
+    # every change
+    def __init__(self, fn, indent=None):
+        self.fn = fn
+        self.indent = indent
+        self.data = None
+
+    def load(self):
+        try:
+            with open(self.fn) as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    def table(self):
+        if self.data is None:
+            self.load()
+        return self.data
+
+    def save(self):
+        # written aside and renamed, so that other processes never read it
+        # half written
+        tmp = '{}.{}.tmp'.format(self.fn, os.getpid())
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.data, f, indent=self.indent)
+            os.replace(tmp, self.fn)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+class PatternCache(JSONCache):
+    def get(self, key, build):
+        patterns = self.table()
+        if key not in patterns:
+            patterns[key] = build()
+            self.save()
+        return patterns[key]
+
+
+pattern_cache = PatternCache(PATTERN_CACHE_FILE)
+
+
 def logic_expr_to_cnf_pattern(expr, symbol_list):
+    from sympy import srepr
+
+    key = srepr(expr) + ' ' + ' '.join(str(s) for s in symbol_list)
+    return pattern_cache.get(key, lambda: _logic_expr_to_cnf_pattern(expr, symbol_list))
+
+
+def _logic_expr_to_cnf_pattern(expr, symbol_list):
     from sympy import Not, to_cnf, Or
 
     def symbol_to_variable(s):
@@ -24,6 +100,10 @@ def logic_expr_to_cnf_pattern(expr, symbol_list):
     return res
 
 def nbit_sequence(n):
+    return pattern_cache.get(f'nbit_sequence {n}', lambda: _nbit_sequence(n))
+
+
+def _nbit_sequence(n):
     from sympy import Xor, And, Or, Not, symbols
 
     def half_adder(a, b):
@@ -51,24 +131,431 @@ def nbit_sequence(n):
     C = [0] * n
     C[0] = 1
     inc_expr = And(*[Not(Xor(b, s)) for b, s in zip(B, nbit_adder(A, C))])
-    cnfs_pattern = logic_expr_to_cnf_pattern(inc_expr, A + B)
+    cnfs_pattern = _logic_expr_to_cnf_pattern(inc_expr, A + B)
     return cnfs_pattern  
 
 
-class SATHelper:
+# Glucose 4, CaDiCaL 1.5, MapleChrono, Minisat 2.2
+PORTFOLIO = ('g4', 'cd15', 'mcb', 'm22')
+PORTFOLIO_STATS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'portfolio_stats.json')
+
+
+class PortfolioStats(JSONCache):
+    def record(self, family, name):
+        wins = self.table().setdefault(family, {})
+        wins[name] = wins.get(name, 0) + 1
+        self.save()
+
+    def ranked(self, family, solvers):
+        wins = self.table().get(family, {})
+        return sorted(solvers, key=lambda name: -wins.get(name, 0))
+
+
+portfolio_stats = PortfolioStats(PORTFOLIO_STATS_FILE, indent=4)
+
+
+class SerialPool:
+    # stands in for multiprocessing.Pool where no worker processes can be
+    # started, as in the browser, the tasks run here one after another
+    def __init__(self, initializer=None, initargs=()):
+        if initializer is not None:
+            initializer(*initargs)
+
+    def map(self, func, items, chunksize=None):
+        return list(map(func, items))
+
+    def imap(self, func, items, chunksize=1):
+        return map(func, items)
+
+    imap_unordered = imap
+
+
+@contextmanager
+def worker_pool(processes=None, initializer=None, initargs=()):
+    # a process pool, or a SerialPool when none can be started
+    try:
+        pool = multiprocessing.Pool(processes, initializer, initargs)
+    except (OSError, ImportError, NotImplementedError):
+        pool = None
+    if pool is None:
+        yield SerialPool(initializer, initargs)
+        return
+    try:
+        yield pool
+    finally:
+        pool.terminate()
+
+
+_solver_limits = {}
+
+
+def solver_limits(name):
+    # (conflict budget, interrupt) support of a backend, probed once on a
+    # tiny formula since pysat only raises when the limit is used
+    if name not in _solver_limits:
+        limits = []
+        for interrupt in (False, True):
+            with Solver(name=name, bootstrap_with=[[1, 2]]) as solver:
+                try:
+                    if interrupt:
+                        solver.solve_limited(expect_interrupt=True)
+                        solver.interrupt()
+                        solver.clear_interrupt()
+                    else:
+                        solver.conf_budget(1)
+                        solver.solve_limited()
+                    limits.append(True)
+                except NotImplementedError:
+                    limits.append(False)
+        _solver_limits[name] = tuple(limits)
+    return _solver_limits[name]
+
+
+def _solve_backend(args):
+    name, cnfs, assumptions = args
+    start = time.perf_counter()
+    with Solver(name=name, bootstrap_with=cnfs) as solver:
+        ret = solver.solve(assumptions=assumptions)
+        model = solver.get_model() if ret else None
+    return name, ret, model, time.perf_counter() - start
+
+
+def solve_portfolio(cnfs, assumptions=(), solvers=PORTFOLIO, family=None):
+    solvers = list(solvers)
+    if family is not None:
+        solvers = portfolio_stats.ranked(family, solvers)
+    assumptions = [int(v) for v in assumptions]
+    tasks = [(name, cnfs, assumptions) for name in solvers]
+    with worker_pool(min(len(tasks), os.cpu_count() or 1)) as pool:
+        if isinstance(pool, SerialPool):
+            # no worker processes in the browser, use the best known backend
+            tasks = tasks[:1]
+        result = next(pool.imap_unordered(_solve_backend, tasks))
+    raced = len(tasks) > 1
+    # only a race decides a win, the ranking would otherwise feed itself
+    if family is not None and raced:
+        portfolio_stats.record(family, result[0])
+    return result
+
+
+SUBSUME_OCCURS_LIMIT = 16
+
+
+def split_variables(cnfs, n):
+    # the variables occurring in most clauses
+    literals = np.fromiter(chain.from_iterable(cnfs), dtype=np.int64)
+    counts = np.bincount(np.abs(literals))
+    counts[0] = 0
+    order = np.argsort(-counts, kind='stable')[:n]
+    return order[counts[order] > 0].tolist()
+
+
+def make_cubes(variables):
+    return [list(cube) for cube in product(*[(v, -v) for v in variables])]
+
+
+_cube_solver = None
+
+
+def _init_cube_worker(name, cnfs):
+    global _cube_solver
+    _cube_solver = Solver(name=name, bootstrap_with=cnfs)
+
+
+def _solve_cube(cube):
+    ret = _cube_solver.solve(assumptions=cube)
+    return cube, ret, _cube_solver.get_model() if ret else None
+
+
+def solve_cubes(cnfs, cubes, assumptions=(), processes=None, solver_name='m22'):
+    # every worker loads the formula once and solves cubes as assumptions,
+    # the cubes have to cover the search space for None to mean UNSAT
+    assumptions = [int(v) for v in assumptions]
+    tasks = [assumptions + cube for cube in cubes]
+    with worker_pool(processes, _init_cube_worker, (solver_name, cnfs)) as pool:
+        for cube, ret, model in pool.imap_unordered(_solve_cube, tasks):
+            if ret:
+                return model
+    return None
+
+
+def write_dimacs(fn, cnfs, nv):
+    with open(fn, 'w') as f:
+        f.write(f'p cnf {nv} {len(cnfs)}\n')
+        for cnf in cnfs:
+            f.write(' '.join(map(str, cnf)))
+            f.write(' 0\n')
+
+
+# binary CNF file: magic, int64 [variables, clauses, literals], int64 clause
+# offsets (clauses + 1), int32 literals
+CNF_MAGIC = b'SATCNF01'
+
+
+def save_cnf(fn, cnfs, nv):
+    offsets = np.zeros(len(cnfs) + 1, dtype=np.int64)
+    np.cumsum([len(cnf) for cnf in cnfs], out=offsets[1:])
+    literals = np.fromiter(chain.from_iterable(cnfs), dtype=np.int32, count=int(offsets[-1]))
+    header = np.array([nv, len(cnfs), len(literals)], dtype=np.int64)
+    with open(fn, 'wb') as f:
+        f.write(CNF_MAGIC)
+        f.write(header.tobytes())
+        f.write(offsets.tobytes())
+        f.write(literals.tobytes())
+
+
+def load_cnf(fn):
+    with open(fn, 'rb') as f:
+        if f.read(len(CNF_MAGIC)) != CNF_MAGIC:
+            raise ValueError(f'{fn} is not a binary CNF file')
+        nv, n_clauses, n_literals = np.frombuffer(f.read(24), dtype=np.int64).tolist()
+    start = len(CNF_MAGIC) + 24
+    offsets = np.memmap(fn, dtype=np.int64, mode='r', offset=start, shape=(n_clauses + 1,))
+    start += offsets.nbytes
+    if n_literals:
+        literals = np.memmap(fn, dtype=np.int32, mode='r', offset=start, shape=(n_literals,))
+    else:
+        literals = np.zeros(0, dtype=np.int32)
+    return nv, literals, offsets
+
+
+def presolve(cnfs, frozen=()):
+    # unit propagation, pure literal elimination and subsumption, returns
+    # None if the clauses are unsatisfiable, otherwise the remaining clauses,
+    # the implied units, {pure literal: clauses it removed} and the number of
+    # subsumed clauses
+    frozen = set(frozen)
+    clauses = []
+    for cnf in cnfs:
+        cnf = set(cnf)
+        if not cnf:
+            return None
+        if not any(-v in cnf for v in cnf):
+            clauses.append(cnf)
+
+    occurs = defaultdict(list)
+    for i, cnf in enumerate(clauses):
+        for v in cnf:
+            occurs[v].append(i)
+    alive = [True] * len(clauses)
+
+    assigned = set()
+    units = []
+    queue = [next(iter(cnf)) for cnf in clauses if len(cnf) == 1]
+    while queue:
+        lit = queue.pop()
+        if abs(lit) in frozen:
+            # selectors stay as clauses so that the solver can blame them
+            continue
+        if lit in assigned:
+            continue
+        if -lit in assigned:
+            return None
+        assigned.add(lit)
+        units.append(lit)
+        for i in occurs[lit]:
+            alive[i] = False
+        for i in occurs[-lit]:
+            if alive[i]:
+                cnf = clauses[i]
+                cnf.discard(-lit)
+                if not cnf:
+                    return None
+                if len(cnf) == 1:
+                    queue.append(next(iter(cnf)))
+
+    counts = defaultdict(int)
+    for i, cnf in enumerate(clauses):
+        if alive[i]:
+            for v in cnf:
+                counts[v] += 1
+    pure = {}
+    stack = list(counts)
+    while stack:
+        lit = stack.pop()
+        if counts[lit] == 0 or counts[-lit] > 0 or abs(lit) in frozen or lit in pure:
+            continue
+        removed = []
+        for i in occurs[lit]:
+            if alive[i]:
+                alive[i] = False
+                removed.append(list(clauses[i]))
+                for v in clauses[i]:
+                    counts[v] -= 1
+                    if counts[v] == 0:
+                        stack.append(-v)
+        pure[lit] = removed
+
+    # duplicates and clauses containing a binary clause are found by lookup,
+    # longer subsuming clauses only scan short occurrence lists
+    order = sorted((i for i in range(len(clauses)) if alive[i]), key=lambda i: len(clauses[i]))
+    seen = set()
+    binaries = set()
+    occurs = defaultdict(list)
+    subsumed = 0
+    for i in order:
+        cnf = clauses[i]
+        key = frozenset(cnf)
+        if key in seen or (len(cnf) > 2 and any(frozenset(c) in binaries for c in combinations(cnf, 2))):
+            alive[i] = False
+            subsumed += 1
+            continue
+        seen.add(key)
+        if len(cnf) == 2:
+            binaries.add(key)
+        for v in cnf:
+            occurs[v].append(i)
+
+    for i in order:
+        cnf = clauses[i]
+        if not alive[i] or len(cnf) < 3:
+            continue
+        lit = min(cnf, key=lambda v: len(occurs[v]))
+        if len(occurs[lit]) > SUBSUME_OCCURS_LIMIT:
+            continue
+        for j in occurs[lit]:
+            if alive[j] and len(clauses[j]) > len(cnf) and cnf <= clauses[j]:
+                alive[j] = False
+                subsumed += 1
+
+    return [list(clauses[i]) for i in order if alive[i]], units, pure, subsumed
+
+
+def constraint(method):
+    # clauses are counted and timed under the outermost constraint method on
+    # the stack
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.tag is not None:
+            return method(self, *args, **kwargs)
+        self.tag = method.__name__
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.tag = None
+            self.stats.encode_time += time.perf_counter() - start
+    return wrapper
+
+
+def encoding(method):
+    # clauses added directly are timed here, inside a constraint method the
+    # time is already counted
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.tag is not None:
+            return method(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.stats.encode_time += time.perf_counter() - start
+    return wrapper
+
+
+class SolveStats:
+    def __init__(self):
+        self.variables = 0
+        self.clauses = defaultdict(int)
+        self.conflicts = 0
+        self.decisions = 0
+        self.propagations = 0
+        self.restarts = 0
+        self.presolve = {}
+        self.encode_time = 0.0
+        self.solve_time = 0.0
+
+    def __repr__(self):
+        clauses = ', '.join(f'{k}={v}' for k, v in self.clauses.items())
+        return (f'SolveStats(variables={self.variables}, clauses=[{clauses}], '
+                f'conflicts={self.conflicts}, decisions={self.decisions}, '
+                f'propagations={self.propagations}, presolve={self.presolve}, '
+                f'encode_time={self.encode_time:.3f}, solve_time={self.solve_time:.3f})')
+
+
+class VariablePool:
     def __init__(self):
         self.current = 1
-        self.cnfs = []
-        self.solver = Solver()
+        self.blocks = {}
 
     def __next__(self):
         v = self.current
         self.current += 1
         return v
 
+    def get_variables(self, n):
+        n = int(n)
+        variables = list(range(self.current, self.current + n))
+        self.current += n
+        return variables
+
+    def block(self, name, shape):
+        shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        size = int(np.prod(shape))
+        variables = np.arange(self.current, self.current + size).reshape(shape)
+        self.current += size
+        self.blocks[name] = variables
+        return variables
+
+    def decode(self, model, variables):
+        # boolean array with the shape of the block, variables missing from
+        # the model are false
+        if isinstance(variables, str):
+            variables = self.blocks[variables]
+        variables = np.asarray(variables)
+        model = np.asarray(model)
+        index = np.abs(variables) - 1
+        inside = index < len(model)
+        values = np.zeros(variables.shape, dtype=bool)
+        values[inside] = model[index[inside]] > 0
+        return values == (variables > 0)
+
+
+class SATHelper:
+    def __init__(self, keep_cnfs=True, solver_name=None, presolve=False):
+        self.pool = VariablePool()
+        self.keep_cnfs = keep_cnfs
+        # with presolve the clauses are buffered until the first solve
+        self.buffer = [] if presolve else None
+        self.presolved = False
+        self.units = []
+        self.pure = {}
+        self.sent = 0
+        self.trivial_model = None
+        self.cnfs = []
+        self.counters = {}
+        self.scopes = []
+        self.scope_counters = []
+        self.givens = {}
+        self.given_selector = None
+        self.solver_name = 'm22' if solver_name is None else solver_name
+        self.solver = Solver(name=self.solver_name)
+        self.tag = None
+        self.status = None
+        self.stats = SolveStats()
+
+    @property
+    def current(self):
+        return self.pool.current
+
+    @current.setter
+    def current(self, value):
+        self.pool.current = value
+
+    def __next__(self):
+        return next(self.pool)
+
+    def block(self, name, shape):
+        return self.pool.block(name, shape)
+
+    def decode(self, model, variables):
+        return self.pool.decode(model, variables)
+
+    @constraint
     def not_(self, v):        
         self.extend([[-v]])
         
+    @constraint
     def not_dnf(self, dnf):
         self.extend([[-v for v in dnf]])
 
@@ -79,53 +566,218 @@ class SATHelper:
             return self._get_variables(n)
 
     def _get_variables(self, n):
-        n = int(n)
-        variables = list(range(self.current, self.current + n))
-        self.current += n
-        return variables
+        return self.pool.get_variables(n)
 
-    def exact_n(self, variables, n, extend=True):
-        cnfs = []
+    @constraint
+    def exact_n(self, variables, n, extend=True, encoding=None):
         variables = [int(v) for v in variables]
-        for c in combinations(variables, n + 1):
-            cnfs.append([-v for v in c])
-
-        for c in combinations(variables, len(variables) - n + 1):
-            cnfs.append([v for v in c])
+        cnfs = self.atmost_k(variables, n, extend=False, encoding=encoding)
+        cnfs += self.atleast_k(variables, n, extend=False, encoding=encoding)
 
         if extend:
             self.extend(cnfs)
 
         return cnfs
 
-    def atmost_one(self, variables, extend=True):
+    @constraint
+    def atmost_one(self, variables, extend=True, encoding=None):
+        return self.atmost_k(variables, 1, extend=extend, encoding=encoding)
+
+    @constraint
+    def atmost_k(self, variables, k, extend=True, encoding=None):
         variables = [int(v) for v in variables]
-        cnfs = []
-        for v1, v2 in combinations(variables, 2):
-            cnfs.append([-v1, -v2])
+        n = len(variables)
+        if k >= n:
+            cnfs = []
+        elif k < 0:
+            cnfs = [[]]
+        elif k == 0:
+            cnfs = [[-v] for v in variables]
+        else:
+            if encoding is None:
+                encoding = card_encoding(n, k)
+            if encoding == 'binomial':
+                cnfs = [[-v for v in c] for c in combinations(variables, k + 1)]
+            elif encoding == 'seqcounter':
+                cnfs = self._seqcounter(variables, k)
+            elif encoding == 'totalizer':
+                outputs, cnfs = self.counter(variables, k + 1, extend=extend)
+                cnfs = [] if extend else cnfs
+                cnfs.append([-outputs[k]])
+            else:
+                raise ValueError(f'unknown cardinality encoding: {encoding}')
 
         if extend:
             self.extend(cnfs)
 
         return cnfs
 
-    def equals_to(self, variables, counts, extend=True):
-        dnfs = []
+    @constraint
+    def atleast_k(self, variables, k, extend=True, encoding=None):
+        variables = [-int(v) for v in variables]
+        return self.atmost_k(variables, len(variables) - k, extend=extend, encoding=encoding)
+
+    def _seqcounter(self, variables, k):
+        # Sinz's sequential counter: prev[j] is true if at least j + 1 of the
+        # variables seen so far are true
+        cnfs = []
+        prev = []
+        for i, x in enumerate(variables):
+            if len(prev) == k:
+                cnfs.append([-x, -prev[k - 1]])
+            if i == len(variables) - 1:
+                break
+            cur = self._get_variables(min(i + 1, k))
+            cnfs.append([-x, cur[0]])
+            for j in range(len(cur)):
+                if j < len(prev):
+                    cnfs.append([-prev[j], cur[j]])
+                if j > 0:
+                    cnfs.append([-x, -prev[j - 1], cur[j]])
+            prev = cur
+        return cnfs
+
+    def _totalizer(self, variables, limit):
+        # unary counter: outputs[i] is true iff at least i + 1 variables are
+        # true, the last output saturates when the counter is truncated
+        if len(variables) == 1:
+            return variables, []
+        mid = len(variables) // 2
+        a, cnfs = self._totalizer(variables[:mid], limit)
+        b, cnfs_b = self._totalizer(variables[mid:], limit)
+        cnfs += cnfs_b
+        m = min(len(a) + len(b), limit)
+        outputs = self._get_variables(m)
+        for i in range(len(a) + 1):
+            for j in range(len(b) + 1):
+                if 0 < i + j <= m:
+                    cnf = [outputs[i + j - 1]]
+                    if i > 0:
+                        cnf.append(-a[i - 1])
+                    if j > 0:
+                        cnf.append(-b[j - 1])
+                    cnfs.append(cnf)
+                if i + j < m:
+                    cnf = [-outputs[i + j]]
+                    if i < len(a):
+                        cnf.append(a[i])
+                    if j < len(b):
+                        cnf.append(b[j])
+                    cnfs.append(cnf)
+        return outputs, cnfs
+
+    @constraint
+    def counter(self, variables, limit=None, extend=True):
         variables = [int(v) for v in variables]
-        index = list(range(len(variables)))
-        for c in counts:
-            for plus_index in combinations(index, c):
-                dnf = [-v for v in variables]
-                for i in plus_index:
-                    dnf[i] *= -1
-                dnfs.append(dnf)
-        return self.dnf_to_cnf(dnfs, extend=extend)
+        if limit is None or limit > len(variables):
+            limit = len(variables)
+        key = tuple(variables)
+        outputs = self.counters.get(key, [])
+        if limit == 0 or len(outputs) >= limit:
+            return outputs[:limit], []
+
+        outputs, cnfs = self._totalizer(variables, limit)
+        if extend:
+            self.counters[key] = outputs
+            self.extend(cnfs)
+
+        return outputs, cnfs
 
+    @constraint
+    def equals_to(self, variables, counts, extend=True):
+        counts = set(counts)
+        outputs, cnfs = self.counter(variables, max(counts) + 1, extend=extend)
+        cnfs = [] if extend else cnfs
+        for c in range(len(outputs) + 1):
+            if c in counts:
+                continue
+            cnf = []
+            if c > 0:
+                cnf.append(-outputs[c - 1])
+            if c < len(outputs):
+                cnf.append(outputs[c])
+            cnfs.append(cnf)
+
+        if extend:
+            self.extend(cnfs)
+
+        return cnfs
+
+    @encoding
     def extend(self, cnfs):
         cnfs = [[int(v) for v in cnf] for cnf in cnfs]
-        self.cnfs.extend(cnfs)
+        self._append(cnfs)
+
+    @encoding
+    def extend_array(self, literals, offsets=None):
+        # literals is either a 2D array with one clause per row, or a flat
+        # array with clause i in literals[offsets[i]:offsets[i + 1]]
+        literals = np.asarray(literals)
+        if offsets is None:
+            cnfs = literals.reshape(len(literals), -1).tolist()
+        else:
+            literals = literals.tolist()
+            offsets = np.asarray(offsets).tolist()
+            cnfs = [literals[s:e] for s, e in zip(offsets[:-1], offsets[1:])]
+        self._append(cnfs)
+
+    def _append(self, cnfs):
+        self.stats.clauses[self.tag or 'extend'] += len(cnfs)
+        guard = []
+        if self.scopes:
+            # clauses of the innermost scope only hold while its selector is
+            # assumed, enclosing scopes are always popped after it
+            guard.append(-self.scopes[-1])
+        if self.given_selector is not None:
+            guard.append(-self.given_selector)
+        if guard:
+            cnfs = [guard + cnf for cnf in cnfs]
+        if self.keep_cnfs:
+            self.cnfs.extend(cnfs)
+        self._send(cnfs)
+
+    def _send(self, cnfs):
+        if self.buffer is not None:
+            self.buffer.extend(cnfs)
+            return
+        if self.pure:
+            self._restore({v for cnf in cnfs for v in cnf})
+        self.sent += len(cnfs)
         self.solver.append_formula(cnfs)
 
+    def _restore(self, literals):
+        # a pure literal stops being pure once its negation shows up again,
+        # so the clauses it satisfied go back to the solver
+        for v in literals:
+            removed = self.pure.pop(-v, None)
+            if removed is not None:
+                self._send(removed)
+
+    def _presolve(self, assumptions):
+        buffer, self.buffer = self.buffer, None
+        self.presolved = True
+        result = presolve(buffer, {abs(v) for v in assumptions})
+        if result is None:
+            self._send([[]])
+            return
+        cnfs, self.units, self.pure, subsumed = result
+        self.solver.append_formula([[v] for v in self.units])
+        self._send(cnfs)
+        self.stats.presolve = dict(
+            clauses=len(buffer), units=len(self.units), pure=len(self.pure),
+            subsumed=subsumed, remaining=len(cnfs))
+
+    def _model(self):
+        if self.trivial_model is not None:
+            return self.trivial_model
+        model = self.solver.get_model()
+        if self.presolved and model is not None:
+            model = model + [-v for v in range(len(model) + 1, self.current)]
+            for v in self.pure:
+                model[abs(v) - 1] = v
+        return model
+
+    @constraint
     def implies(self, A, B, extend=True):
         if isinstance(B, int):
             B = [B]
@@ -136,12 +788,14 @@ class SATHelper:
 
         return cnf
 
+    @constraint
     def implies_all(self, A, Bs, extend=True):
         cnfs = []
         for B in Bs:
             cnfs.append(self.implies(A, B, extend=extend))
         return cnfs        
 
+    @constraint
     def dnf_to_cnf(self, dnf, extend=True):
         zlist = []
         cnfs = []
@@ -158,6 +812,7 @@ class SATHelper:
 
         return cnfs
 
+    @constraint
     def replace_cnf_pattern(self, cnf_pattern, variables, extend=True):
         def r(v):
             idx = abs(v) - 1
@@ -171,11 +826,194 @@ class SATHelper:
             self.extend(cnfs)
         return cnfs
 
+    @constraint
     def implies_pattern(self, v, cnf_pattern, variables, extend=True):
         cnfs = self.replace_cnf_pattern(cnf_pattern, variables, extend=False)
         return self.implies_all(v, cnfs, extend=extend)
 
-    def solve(self):
-        ret = self.solver.solve()
-        if ret is not None:
-            return self.solver.get_model()
\ No newline at end of file
+    def push(self):
+        selector = next(self)
+        self.scopes.append(selector)
+        self.scope_counters.append(dict(self.counters))
+        return selector
+
+    def pop(self):
+        selector = self.scopes.pop()
+        # counters built inside the scope lose their defining clauses
+        self.counters = self.scope_counters.pop()
+        if self.keep_cnfs:
+            self.cnfs.append([-selector])
+        self._send([[-selector]])
+
+    @contextmanager
+    def tagged(self, name):
+        # clauses built outside the constraint methods and extended in the
+        # block are counted and timed under name, an enclosing tag wins
+        if self.tag is not None:
+            yield
+            return
+        self.tag = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tag = None
+            self.stats.encode_time += time.perf_counter() - start
+
+    @contextmanager
+    def given(self, label):
+        # clauses added in the block can be reported by unsat_core as label
+        selector = next(self)
+        self.givens[selector] = label
+        outer, self.given_selector = self.given_selector, selector
+        try:
+            yield selector
+        finally:
+            self.given_selector = outer
+
+    def unsat_core(self, assumptions=(), timeout=1.0):
+        # shrink the failed assumptions and givens by deletion until every
+        # element is needed or the time is up, givens are returned as labels
+        assumptions = [int(v) for v in assumptions] + list(self.givens)
+        if self._solve(self.scopes + assumptions) is not False:
+            return None
+        candidates = set(assumptions)
+        # a formula that is unsat without assumptions has no core
+        core = [v for v in assumptions if v in set(self.solver.get_core() or ())]
+        deadline = time.perf_counter() + timeout
+        i = 0
+        while i < len(core):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            trial = core[:i] + core[i + 1:]
+            if self._solve(self.scopes + trial, timeout=remaining) is False:
+                failed = set(self.solver.get_core() or ()) & candidates
+                core = [v for v in trial if v in failed]
+            else:
+                i += 1
+        self.status = 'UNSAT'
+        return [self.givens.get(v, v) for v in core]
+
+    def _assumptions(self, assumptions):
+        return [int(v) for v in assumptions] + self.scopes + list(self.givens)
+
+    def _solve(self, assumptions, timeout=None, conflict_budget=None):
+        if timeout is not None or conflict_budget is not None:
+            budget, interrupt = solver_limits(self.solver_name)
+            if timeout is not None and not interrupt:
+                raise ValueError(f'{self.solver_name} cannot be interrupted, solve without timeout')
+            if conflict_budget is not None and not budget:
+                raise ValueError(f'{self.solver_name} has no conflict budget, solve without conflict_budget')
+        if self.buffer is not None:
+            self._presolve(assumptions)
+        if self.pure:
+            self._restore(assumptions)
+        start = time.perf_counter()
+        solver = self.solver
+        self.trivial_model = None
+        fixed = set(self.units + assumptions)
+        if self.presolved and self.sent == 0 and not any(-v in fixed for v in fixed):
+            # every clause was decided by the presolver, a conflict with the
+            # assumptions still goes to the solver for its core
+            ret = True
+            model = [-v for v in range(1, self.current)]
+            for v in self.units + list(self.pure) + assumptions:
+                model[abs(v) - 1] = v
+            self.trivial_model = model
+        elif timeout is None and conflict_budget is None:
+            ret = solver.solve(assumptions=assumptions)
+        else:
+            solver.conf_budget(-1 if conflict_budget is None else conflict_budget)
+            timer = None
+            if timeout is not None:
+                timer = threading.Timer(timeout, solver.interrupt)
+                try:
+                    timer.start()
+                except RuntimeError:
+                    # no threads in the browser, only the conflict budget applies
+                    timer = None
+            try:
+                ret = solver.solve_limited(assumptions=assumptions, expect_interrupt=timer is not None)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                    solver.clear_interrupt()
+
+        stats = self.stats
+        stats.solve_time += time.perf_counter() - start
+        stats.variables = self.current - 1
+        for key, value in solver.accum_stats().items():
+            setattr(stats, key, value)
+        self.status = {True: 'SAT', False: 'UNSAT', None: 'UNKNOWN'}[ret]
+        return ret
+
+    def solve(self, assumptions=(), timeout=None, conflict_budget=None):
+        ret = self._solve(self._assumptions(assumptions), timeout, conflict_budget)
+        if ret:
+            return self._model()
+
+    def solve_portfolio(self, assumptions=(), solvers=PORTFOLIO, family=None):
+        if not self.keep_cnfs:
+            raise ValueError('solve_portfolio needs the clauses kept in self.cnfs')
+        name, ret, model, elapsed = solve_portfolio(
+            self.cnfs, self._assumptions(assumptions), solvers, family)
+        self.portfolio_winner = name
+        self.status = 'SAT' if ret else 'UNSAT'
+        return model
+
+    def solve_cubes(self, split_on=None, depth=None, assumptions=(), processes=None, solver_name='m22'):
+        if not self.keep_cnfs:
+            raise ValueError('solve_cubes needs the clauses kept in self.cnfs')
+        if depth is None:
+            # four to eight cubes per worker
+            depth = (processes or os.cpu_count() or 1).bit_length() + 2
+        if split_on is None:
+            split_on = split_variables(self.cnfs, depth)
+        cubes = make_cubes([int(v) for v in split_on][:depth])
+        model = solve_cubes(self.cnfs, cubes, self._assumptions(assumptions), processes, solver_name)
+        self.status = 'UNSAT' if model is None else 'SAT'
+        return model
+
+    def to_dimacs(self, fn):
+        if not self.keep_cnfs:
+            raise ValueError('to_dimacs needs the clauses kept in self.cnfs')
+        write_dimacs(fn, self.cnfs, self.current - 1)
+
+    def save(self, fn):
+        if not self.keep_cnfs:
+            raise ValueError('save needs the clauses kept in self.cnfs')
+        save_cnf(fn, self.cnfs, self.current - 1)
+
+    @classmethod
+    def load(cls, fn, **kwargs):
+        sat = cls(**kwargs)
+        nv, literals, offsets = load_cnf(fn)
+        sat.current = nv + 1
+        sat.extend_array(literals, offsets)
+        return sat
+
+    def iter_models(self, limit=None, project_on=None, assumptions=()):
+        if project_on is None:
+            project_on = range(1, self.current)
+        project_on = [int(v) for v in project_on]
+
+        # blocking clauses are guarded by a selector so that they can be
+        # retired when the enumeration stops
+        selector = next(self)
+        assumptions = self._assumptions(assumptions) + [selector]
+        count = 0
+        try:
+            while limit is None or count < limit:
+                if not self._solve(assumptions):
+                    break
+                model = self._model()
+                yield model
+                count += 1
+                block = [-model[v - 1] if v <= len(model) else v for v in project_on]
+                self._send([[-selector] + block])
+        finally:
+            self._send([[-selector]])
+
+    def count_models(self, limit=None, project_on=None, assumptions=()):
+        return sum(1 for _ in self.iter_models(limit, project_on, assumptions))
\ No newline at end of file
@@ -1,13 +1,16 @@
+import time
+import random
+import argparse
 import pysat
 import numpy as np
 from itertools import product, combinations
-from collections import defaultdict
 from pysat.solvers import Solver
 import ipycanvas
 from ipycanvas import Canvas
 from ipyevents import Event
 from bs4 import BeautifulSoup
 from sathelp import SATHelper
+from exact_cover import DancingLinks
 
 def load_board_from_html(html):
     soup = BeautifulSoup(html, 'html.parser')
@@ -34,87 +37,184 @@ def mult_pair(n):
         if i * j == n:
             yield (i, j)
             
-def generate_rectangle(x, y, area, width, height):
-    for w, h in mult_pair(area):
-        for i, j in product(range(w), range(h)):
-            x2 = x - i
-            y2 = y - j
-            if x2 >= 0 and y2 >= 0 and x2 + w <= width and y2 + h <= height:
-                yield(x2, y2, w, h)
-                
-def generate_cell(rect):
-    x, y, w, h = rect
-    for i, j in product(range(w), range(h)):
-        yield (x + i, y + j)
+def rectangle_offsets(area):
+    # (i, j, w, h) for every shape of the area and every cell of the shape
+    # the clue can sit on, the rectangle starts at (x - i, y - j)
+    return np.array([(i, j, w, h) for w, h in mult_pair(area)
+                     for i, j in product(range(w), range(h))], dtype=int).reshape(-1, 4)
+
+
+def rectangle_candidates(board):
+    # the rectangles of every clue that stay on the board and cover no other
+    # clue, as an (n, 4) array of x, y, w, h sorted by clue, and the index of
+    # the clue in np.nonzero(board) order for each of them
+    board = np.asarray(board)
+    height, width = board.shape
+    ys, xs = np.nonzero(board > 0)
+    areas = board[ys, xs]
+    # summed area table of the clue cells
+    table = np.zeros((height + 1, width + 1), dtype=int)
+    table[1:, 1:] = (board > 0).cumsum(0).cumsum(1)
+    rects = [np.zeros((0, 4), dtype=int)]
+    owners = [np.zeros(0, dtype=int)]
+    for area in np.unique(areas).tolist():
+        clues = np.flatnonzero(areas == area)
+        i, j, w, h = rectangle_offsets(area).T
+        x = (xs[clues, None] - i).ravel()
+        y = (ys[clues, None] - j).ravel()
+        w = np.tile(w, len(clues))
+        h = np.tile(h, len(clues))
+        owner = np.repeat(clues, len(i))
+        inside = (x >= 0) & (y >= 0) & (x + w <= width) & (y + h <= height)
+        x, y, w, h, owner = x[inside], y[inside], w[inside], h[inside], owner[inside]
+        count = table[y + h, x + w] - table[y, x + w] - table[y + h, x] + table[y, x]
+        alone = count == 1
+        rects.append(np.stack([x, y, w, h], axis=1)[alone])
+        owners.append(owner[alone])
+    owners = np.concatenate(owners)
+    order = np.argsort(owners, kind='stable')
+    return np.concatenate(rects)[order], owners[order]
+
+
+def rectangle_cells(rects, width, height):
+    # cell to rectangle incidence in CSR form, the rectangles covering cell
+    # y * width + x are indices[indptr[c]:indptr[c + 1]]
+    x, y, w, h = np.asarray(rects, dtype=int).reshape(-1, 4).T
+    sizes = w * h
+    rect = np.repeat(np.arange(len(sizes)), sizes)
+    k = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    cells = (y[rect] + k // w[rect]) * width + x[rect] + k % w[rect]
+    order = np.argsort(cells, kind='stable')
+    indptr = np.zeros(width * height + 1, dtype=int)
+    indptr[1:] = np.bincount(cells, minlength=width * height).cumsum()
+    return indptr, rect[order]
 
 def str_to_board(board_str):
     board = np.array([list(row) for row in board_str.strip().split()]).astype(int)    
     return board.tolist()
 
 
+def random_board(width, height, max_size=6, seed=None):
+    # a solvable board: the grid is cut into random rectangles of at most
+    # max_size cells a side and each area is put on one cell of its rectangle
+    rng = random.Random(seed)
+    used = np.zeros((height, width), dtype=bool)
+    board = np.zeros((height, width), dtype=int)
+    for y, x in product(range(height), range(width)):
+        if used[y, x]:
+            continue
+        w = 1
+        while w < max_size and x + w < width and not used[y, x + w]:
+            w += 1
+        w = rng.randint(1, w)
+        h = rng.randint(1, min(max_size, height - y))
+        used[y:y + h, x:x + w] = True
+        board[y + rng.randrange(h), x + rng.randrange(w)] = w * h
+    return board.tolist()
+
+
 class ShikakuSolver:
-    def __init__(self, board):
+    def __init__(self, board, presolve=False, engine='sat'):
         if isinstance(board, str):
             board = str_to_board(board)
-        elif isinstance(board, list):
-            board = np.array(board)
-            
+        board = np.asarray(board, dtype=int)
         height, width = board.shape
 
-        sat = SATHelper()
-        rect_variables = {}
-        for y, x in zip(*np.where(board > 0)):
-            v = board[y, x]
-            number_rects = {}
-            for rect in generate_rectangle(x, y, v, width, height):
-                number_rects[sat.next()] = rect
-            rect_variables[x, y] = number_rects
-
-        cells = defaultdict(set)
-        for (x0, y0), number_rects in rect_variables.items():
-            for v, rect in number_rects.items():
-                for xc, yc in generate_cell(rect):
-                    cells[xc, yc].add((x0, y0))
-
-        cell_variables = {}
-        for key, value in cells.items():
-            cell_variables[key] = dict(zip(value, sat.next(len(value))))
-
-        self.rect_variables = rect_variables
-        self.cell_variables = cell_variables
+        sat = SATHelper(presolve=presolve)
+        ys, xs = np.nonzero(board > 0)
+        self.clues = list(zip(xs.tolist(), ys.tolist()))
+        self.rects, self.owners = rectangle_candidates(board)
+        self.indptr, self.indices = rectangle_cells(self.rects, width, height)
+        self.rect_variables = sat.block('rect', len(self.rects))
         self.sat = sat
         self.board = board
+        self.engine = engine
 
-    def solve(self):
+    def solve(self, timeout=None):
+        if self.engine == 'dlx':
+            return self._solve_dlx(timeout)
         sat = self.sat
         rect_variables = self.rect_variables
-        cell_variables = self.cell_variables
-        
-        for value in rect_variables.values():
-            sat.exact_n(value.keys(), 1)
+        owners = self.owners
+        indptr, indices = self.indptr, self.indices
+
+        # every clue picks one of its rectangles, the clue cell keeps two of
+        # them from being picked together
+        selectors = []
+        starts = np.searchsorted(owners, np.arange(len(self.clues) + 1))
+        for pos, start, end in zip(self.clues, starts[:-1].tolist(), starts[1:].tolist()):
+            with sat.given(pos) as selector:
+                sat.extend([rect_variables[start:end].tolist()])
+            selectors.append(selector)
+        selectors = np.array(selectors, dtype=int)
 
-        for value in cell_variables.values():
-            sat.exact_n(value.values(), 1)
+        # every cell is covered by at least one rectangle unless a clue that
+        # could cover it is dropped from the core
+        sizes = np.diff(indptr)
+        cells = np.repeat(np.arange(len(sizes)), sizes)
+        count = max(len(self.clues), 1)
+        pairs = np.unique(cells * count + owners[indices])
+        pair_cells = pairs // count
+        literals = np.concatenate([rect_variables[indices], -selectors[pairs % count]])
+        order = np.argsort(np.concatenate([cells, pair_cells]), kind='stable')
+        offsets = np.zeros(len(sizes) + 1, dtype=int)
+        offsets[1:] = np.cumsum(sizes + np.bincount(pair_cells, minlength=len(sizes)))
+        # a cell no rectangle reaches is reported as a conflict by itself
+        empty = offsets[1:] == offsets[:-1]
+        sat.extend_array(literals[order], np.concatenate([[0], offsets[1:][~empty]]))
+        width = self.board.shape[1]
+        for cell in np.flatnonzero(empty).tolist():
+            with sat.given((cell % width, cell // width)):
+                sat.extend([[]])
 
-        for pos, rects in rect_variables.items():
-            dnf = []   
-            for var_rect, rect in rects.items():
-                var_cells = [cell_variables[xc, yc][pos] for xc, yc in generate_cell(rect)]
-                dnf.append([var_rect] + var_cells)
-            sat.dnf_to_cnf(dnf)
+        # and by at most one, a sequential ladder over the rectangles of each
+        # cell: s_k is true when one of the first k + 1 rectangles is picked
+        last = np.zeros(len(indices), dtype=bool)
+        last[indptr[1:][sizes > 0] - 1] = True
+        steps = np.flatnonzero(~last)
+        if len(steps):
+            ladder = np.asarray(sat.block('ladder', len(steps)))
+            lits = rect_variables[indices]
+            chained = ~last[steps + 1]
+            sat.extend_array(np.concatenate([
+                np.stack([-lits[steps], ladder], axis=1),
+                np.stack([-lits[steps + 1], -ladder], axis=1),
+                np.stack([-ladder[:-1][chained[:-1]], ladder[1:][chained[:-1]]], axis=1),
+            ]))
 
-        sol = sat.solve()
+        sol = sat.solve(timeout=timeout)
+        self.conflict = []
+        if sol is None and sat.status == 'UNSAT':
+            self.conflict = sat.unsat_core()
         if sol is not None:
-            sol_rects = []
-            for pos, rects in rect_variables.items():
-                for var_rect, rect in rects.items():
-                    if sol[var_rect - 1] > 0:
-                        sol_rects.append(rect)    
+            sol_rects = [tuple(rect) for rect in self.rects[sat.decode(sol, 'rect')].tolist()]
             self.sol_rects = sol_rects
             return sol_rects
         else:
             return []
-    
+
+    def _solve_dlx(self, timeout):
+        # exact cover with one column per cell, every rectangle covers its
+        # clue cell so a clue never gets two of them
+        sizes = np.diff(self.indptr)
+        cells = np.repeat(np.arange(len(sizes)), sizes)
+        cells = cells[np.argsort(self.indices, kind='stable')].tolist()
+        ends = np.bincount(self.indices, minlength=len(self.rects)).cumsum().tolist()
+        rows = [cells[start:end] for start, end in zip([0] + ends[:-1], ends)]
+        self.dlx = DancingLinks(rows, len(sizes))
+        sol = self.dlx.solve(timeout)
+        # no core without clauses, cells no rectangle reaches are the
+        # conflict
+        self.conflict = []
+        if sol is None:
+            if self.dlx.status == 'UNSAT':
+                width = self.board.shape[1]
+                self.conflict = [(cell % width, cell // width) for cell in np.flatnonzero(sizes == 0).tolist()]
+            return []
+        sol_rects = [tuple(rect) for rect in self.rects[sorted(sol)].tolist()]
+        self.sol_rects = sol_rects
+        return sol_rects
+
     def plot(self):
         x0, y0, w, h = np.array(self.sol_rects).T
         x1 = x0 + w
@@ -128,6 +228,17 @@ class ShikakuSolver:
         return hv.Rectangles((x0, height - y0, x1, height - y1)) * hv.Labels((X + 0.5, height - Y - 0.5, V))
     
 
+def benchmark(boards, engines=('sat', 'dlx'), timeout=None):
+    # seconds to build and solve each board with every engine
+    times = {engine: [] for engine in engines}
+    for board in boards:
+        for engine in engines:
+            start = time.perf_counter()
+            ShikakuSolver(board, engine=engine).solve(timeout)
+            times[engine].append(time.perf_counter() - start)
+    return times
+
+
 class ShikakuGUI:
     def __init__(self, board=None, width=10, height=10, step=20):
         self.step = step
@@ -146,6 +257,7 @@ class ShikakuGUI:
         self.x = 0
         self.y = 0
         self.rects = []
+        self.conflict = []
         self.new_value_flag = True
         self.draw()
         
@@ -183,6 +295,7 @@ class ShikakuGUI:
     def solve(self):
         solver = ShikakuSolver(self.board)
         self.rects = solver.solve()
+        self.conflict = solver.conflict
         self.draw()        
         
     def draw(self):
@@ -207,6 +320,10 @@ class ShikakuGUI:
                 canvas.stroke_rect(1.5 + x * step, 1.5 + y * step, w * step - 1, h * step - 1)
                 canvas.fill_rect(1.5 + x * step, 1.5 + y * step, w * step - 1, h * step - 1)
                 
+            canvas.fill_style = '#ffaaaa'
+            for x, y in self.conflict:
+                canvas.fill_rect(1 + x * step, 1 + y * step, step, step)
+
             canvas.fill_style = '#ffdddd'
             canvas.fill_rect(1 + self.x * step, 1 + self.y * step, step, step)
                 
@@ -215,4 +332,21 @@ class ShikakuGUI:
             canvas.fill_style = '#000000'
             for (y, x), n in np.ndenumerate(self.board):
                 if n != 0:
-                    canvas.fill_text(str(n), 1 + x * step + 0.5 * step, 1 + y * step + 0.5 * step)
\ No newline at end of file
+                    canvas.fill_text(str(n), 1 + x * step + 0.5 * step, 1 + y * step + 0.5 * step)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the Shikaku engines on random boards.')
+    parser.add_argument('sizes', nargs='*', type=int, default=[10, 20, 40], help='board sizes')
+    parser.add_argument('-c', '--count', type=int, default=5, help='boards per size')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per board and engine')
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        boards = [random_board(size, size, seed=seed) for seed in range(args.count)]
+        times = benchmark(boards, timeout=args.timeout)
+        print(size, ' '.join('%s %.3fs' % (engine, sum(t)) for engine, t in times.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -45,13 +45,16 @@ class SlitherLinkSolver:
 
         sat = SATHelper()
 
+        # (y, x) - (y, x + 1) and (y, x) - (y + 1, x)
+        hedges = sat.block('hedge', (h, w - 1))
+        vedges = sat.block('vedge', (h - 1, w))
         self.edges = {}
-        for y, x in edge_locations_sorted:
-            for dy, dx in directs:
-                if dy >= 0 and dx >= 0:
-                    y2, x2 = y + dy, x + dx
-                    if (y2, x2) in edge_locations:
-                        self.edges[y, x, y2, x2] = sat.next()
+        for (y, x), v in np.ndenumerate(hedges):
+            self.edges[y, x, y, x + 1] = int(v)
+        for (y, x), v in np.ndenumerate(vedges):
+            self.edges[y, x, y + 1, x] = int(v)
+        self.edge_keys = np.array(list(self.edges.keys())).reshape(-1, 4)
+        self.edge_variables = np.array(list(self.edges.values()))
 
         self.dot_links = defaultdict(list)
 
@@ -86,7 +89,7 @@ class SlitherLinkSolver:
 
         self.sat = sat
 
-    def solve(self):
+    def solve(self, timeout=None):
         def pop_path(edges, start):
             path = [start]
             while True:
@@ -106,16 +109,15 @@ class SlitherLinkSolver:
 
         m = []
         for i in range(100):
-            m = self.sat.solve()
+            m = self.sat.solve(timeout=timeout)
             if m is None:
                 m = []
                 break
             neighbours = defaultdict(set)
 
-            for (y1, x1, y2, x2), v in self.edges.items():
-                if m[v - 1] > 0:
-                    neighbours[y1, x1].add((y2, x2))
-                    neighbours[y2, x2].add((y1, x1))
+            for y1, x1, y2, x2 in self.edge_keys[self.sat.decode(m, self.edge_variables)].tolist():
+                neighbours[y1, x1].add((y2, x2))
+                neighbours[y2, x2].add((y1, x1))
 
             pathes = []
 
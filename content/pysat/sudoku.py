@@ -1,70 +1,364 @@
+import os
+import sys
+import time
+import argparse
+from functools import partial
 from ipyevents import Event
 import numpy as np
-from itertools import combinations
-from pysat.solvers import Solver
 import ipycanvas
-from ipycanvas import Canvas
+from ipycanvas import MultiCanvas
+from pysat.solvers import Solver
+from sathelp import SATHelper, load_cnf, worker_pool
+
+# blank first, 25 x 25 boards use the digits and letters up to P
+SYMBOLS = '0123456789ABCDEFGHIJKLMNOP'
+SYMBOL_CODES = np.zeros(256, dtype=np.uint8)
+for i, symbol in enumerate(SYMBOLS):
+    SYMBOL_CODES[ord(symbol)] = SYMBOL_CODES[ord(symbol.lower())] = i
+
+# bump when build_formula changes, cache files of other versions are ignored
+FORMULA_VERSION = 1
+FORMULA_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'sudoku_{}_{}_v%d.cnf' % FORMULA_VERSION)
+
+def box_view(a):
+    # (..., row, col) <-> (..., box, cell), the mapping is its own inverse
+    n = a.shape[-1]
+    b = int(round(n ** 0.5))
+    return np.swapaxes(a.reshape(a.shape[:-2] + (b, b, b, b)), -3, -2).reshape(a.shape)
+
+def unit_masks(masks):
+    # digits seen at least once and at least twice along the last axis
+    once = np.zeros(masks.shape[:-1], dtype=masks.dtype)
+    twice = np.zeros_like(once)
+    for i in range(masks.shape[-1]):
+        twice |= once & masks[..., i]
+        once |= masks[..., i]
+    return once, twice
+
+def spread(row, col, box):
+    # unit masks back onto the cells of each unit
+    n = row.shape[-1]
+    box = np.broadcast_to(box[..., :, None], box.shape + (n,))
+    return row[..., :, None] | col[..., None, :] | box_view(box)
+
+def propagate(boards):
+    # naked and hidden singles with one candidate bitmask per cell, every
+    # board of the batch goes through the same array operations, returns
+    # the masks and which boards are free of contradictions
+    boards = np.asarray(boards)
+    n = boards.shape[-1]
+    full = np.uint32((1 << n) - 1)
+    digits = boards.reshape(-1, n, n).astype(np.uint32)
+    cand = np.where(digits > 0, np.left_shift(np.uint32(1), digits - 1), full)
+    ok = np.ones(len(cand), dtype=bool)
+    active = np.arange(len(cand))
+    while len(active):
+        masks = cand[active]
+        single = (masks & (masks - 1)) == 0
+        solved = np.where(single, masks, 0)
+        units = [unit_masks(solved), unit_masks(np.swapaxes(solved, -1, -2)),
+                 unit_masks(box_view(solved))]
+        taken = spread(*[once for once, twice in units])
+        new = np.where(single, masks, masks & ~taken)
+
+        counts = [unit_masks(new), unit_masks(np.swapaxes(new, -1, -2)),
+                  unit_masks(box_view(new))]
+        hidden = new & spread(*[once & ~twice for once, twice in counts])
+        new = np.where(hidden != 0, hidden, new)
+
+        bad = (new == 0).any(axis=(1, 2)) | ((hidden & (hidden - 1)) != 0).any(axis=(1, 2))
+        for (_, twice), (once, _) in zip(units, counts):
+            bad |= (twice != 0).any(axis=1) | (once != full).any(axis=1)
+        ok[active[bad]] = False
+
+        changed = (new != masks).any(axis=(1, 2)) & ~bad
+        cand[active[changed]] = new[changed]
+        active = active[changed]
+    return cand.reshape(boards.shape), ok.reshape(boards.shape[:-2])
+
+def build_formula(n, encoding=None):
+    # exactly one per cell, and every digit exactly once per row, column and
+    # box, the n ** 3 cell variables come first
+    sat = SATHelper()
+    bools = np.array(sat.next(n ** 3)).reshape(n, n, n)
+    digits = np.moveaxis(bools, 2, 0)
+    groups = np.concatenate([bools.reshape(-1, n),
+                             digits.reshape(-1, n),
+                             np.swapaxes(digits, 1, 2).reshape(-1, n),
+                             box_view(digits).reshape(-1, n)])
+    with sat.tagged('atleast_one'):
+        sat.extend_array(groups)
+    for group in groups.tolist():
+        sat.atmost_one(group, encoding=encoding)
+    return sat
+
+_formulas = {}
+
+def base_formula(n, encoding=None):
+    # (nv, literals, offsets) of the base formula, built once per size and
+    # kept in memory and on disk
+    if encoding is None:
+        encoding = 'binomial' if n <= 9 else 'seqcounter'
+    key = n, encoding
+    if key not in _formulas:
+        fn = FORMULA_CACHE_FILE.format(n, encoding)
+        try:
+            _formulas[key] = load_cnf(fn)
+        except (OSError, ValueError):
+            sat = build_formula(n, encoding)
+            # written aside and renamed, so that workers mapping the file
+            # never see it half written
+            tmp = '{}.{}.tmp'.format(fn, os.getpid())
+            try:
+                sat.save(tmp)
+                os.replace(tmp, fn)
+                _formulas[key] = load_cnf(fn)
+            except (OSError, ValueError):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                literals = [v for cnf in sat.cnfs for v in cnf]
+                offsets = np.cumsum([0] + [len(cnf) for cnf in sat.cnfs])
+                _formulas[key] = sat.current - 1, literals, offsets
+    return _formulas[key]
+
+_clauses = {}
+
+def base_clauses(n, encoding=None):
+    # the base formula as clause lists, for the solvers built per puzzle
+    key = n, encoding
+    if key not in _clauses:
+        nv, literals, offsets = base_formula(n, encoding)
+        literals = np.asarray(literals).tolist()
+        offsets = np.asarray(offsets).tolist()
+        _clauses[key] = [literals[s:e] for s, e in zip(offsets[:-1], offsets[1:])]
+    return _clauses[key]
 
-def get_conditions(bools):
-    conditions = []
-    n = bools.shape[-1]
-    index = np.array(list(combinations(range(n), 2)))
-    conditions.extend(bools.reshape(-1, n).tolist())
-    conditions.extend((-bools[..., index].reshape(-1, 2)).tolist())
-    return conditions
+def format_solution(model, n=9):
+    solution = np.array(model[:n ** 3]).reshape(n, n, n)
+    return (np.where(solution > 0)[2] + 1).reshape(n, n)
 
-def format_solution(solution):
-    solution = np.array(solution).reshape(9, 9, 9)
-    return (np.where(solution > 0)[2] + 1).reshape(9, 9)
+def parse_lines(lines, n=9):
+    # n * n symbols per line, blanks as '0' or '.'
+    data = ''.join(line.strip() for line in lines).encode()
+    return SYMBOL_CODES[np.frombuffer(data, dtype=np.uint8)].reshape(-1, n, n)
+
+def valid_line(line, n=9):
+    # n * n symbols of the board size, blank and other lines are reported as
+    # unsolvable instead of stopping the whole batch
+    data = line.strip().encode()
+    return len(data) == n * n and SYMBOL_CODES[np.frombuffer(data, dtype=np.uint8)].max() <= n
+
+def format_line(solution):
+    return ''.join([SYMBOLS[v] for v in solution.ravel().tolist()])
 
 class SudokuSolver:
-    def __init__(self):
-        self.bools = np.arange(1, 9 * 9 * 9 + 1).reshape(9, 9, 9)
-        c1 = get_conditions(self.bools)
-        c2 = get_conditions(np.swapaxes(self.bools, 1, 2))
-        c3 = get_conditions(np.swapaxes(self.bools, 0, 2))
-
-        tmp = np.swapaxes(self.bools.reshape(3, 3, 3, 3, 9), 1, 2).reshape(9, 9, 9)
-        c4 = get_conditions(np.swapaxes(tmp, 1, 2))
-        self.conditions = c1 + c2 + c3 + c4        
-        self.solver = Solver()
-        self.solver.append_formula(self.conditions)
+    def __init__(self, n=9, propagate=False, encoding=None):
+        self.n = n
+        self.propagate = propagate
+        self.encoding = encoding
+        self.sat = SATHelper(keep_cnfs=False)
+        nv, literals, offsets = base_formula(n, encoding)
+        self.sat.current = nv + 1
+        with self.sat.tagged('base_formula'):
+            self.sat.extend_array(literals, offsets)
+        self.bools = np.arange(1, n ** 3 + 1).reshape(n, n, n)
+        self.solver = self.sat.solver
 
     def solve(self, board):
-        sudoku = np.array([[int(x) for x in line] for line in board])
+        sudoku = np.array([[SYMBOLS.index(x) for x in line] for line in board])
+        solution = self.solve_array(sudoku)
+        if solution is not None:
+            return np.array(list(SYMBOLS))[solution].tolist()
+
+    def solve_line(self, line):
+        return self.solve_lines([line])[0]
+
+    def solve_lines(self, lines):
+        # None for unsolvable and malformed lines
+        valid = [valid_line(line, self.n) for line in lines]
+        if not all(valid):
+            results = iter(self.solve_lines([line for line, ok in zip(lines, valid) if ok]))
+            return [next(results) if ok else None for ok in valid]
+        boards = parse_lines(lines, self.n)
+        if self.propagate:
+            cands, oks = propagate(boards)
+        else:
+            cands = oks = [None] * len(boards)
+        results = []
+        for sudoku, cand, ok in zip(boards, cands, oks):
+            solution = self.solve_array(sudoku, explain=False, cand=cand, ok=ok)
+            if solution is not None:
+                solution = format_line(solution)
+            results.append(solution)
+        return results
+
+    def solve_array(self, sudoku, explain=True, cand=None, ok=None):
+        self.conflict = []
+        if cand is None and self.propagate:
+            cand, ok = propagate(sudoku)
+        if cand is None:
+            r, c = np.where(sudoku != 0)
+            model = self.sat.solve(self.bools[r, c, sudoku[r, c] - 1].tolist())
+            if model is not None:
+                return format_solution(model, self.n)
+        elif ok:
+            decided = (cand & (cand - 1)) == 0
+            if decided.all():
+                return np.frexp(cand)[1]
+            # only the undecided cells are left to the solver
+            r, c = np.where(decided)
+            v = np.frexp(cand[r, c])[1] - 1
+            model = self.sat.solve(self.bools[r, c, v].tolist())
+            if model is not None:
+                return format_solution(model, self.n)
+        if not explain:
+            return None
+
+        # no solution, solve again on the givens alone to explain it
         r, c = np.where(sudoku != 0)
         v = sudoku[r, c] - 1
-        conditions2 = self.bools[r, c, v][:, None].tolist()
-        self.solver.solve(assumptions=self.bools[r, c, v].tolist())
-        solution = format_solution(self.solver.get_model())
-        return solution.astype('str').tolist()
+        assumptions = self.bools[r, c, v].tolist()
+        cells = dict(zip(assumptions, zip(r.tolist(), c.tolist())))
+        self.conflict = [cells[v] for v in self.sat.unsat_core(assumptions) or []]
+        return None
+
+    def grade(self, board, fresh=False):
+        sudoku = np.array([[SYMBOLS.index(x) for x in line] for line in board])
+        grade = self.grade_array(sudoku, fresh)
+        if grade['solution'] is not None:
+            grade['solution'] = np.array(list(SYMBOLS))[grade['solution']].tolist()
+        return grade
+
+    def grade_lines(self, lines, fresh=False):
+        # None for malformed lines
+        valid = [valid_line(line, self.n) for line in lines]
+        boards = iter(parse_lines([line for line, ok in zip(lines, valid) if ok], self.n))
+        grades = [self.grade_array(next(boards), fresh) if ok else None for ok in valid]
+        for grade in grades:
+            if grade is not None and grade['solution'] is not None:
+                grade['solution'] = format_line(grade['solution'])
+        return grades
+
+    def grade_array(self, sudoku, fresh=False):
+        # the solver effort of the first model grades the puzzle. On the
+        # shared solver it depends on the learnt clauses and phases left by
+        # earlier puzzles, fresh=True solves on a new solver instead, which
+        # is reproducible but costs about 10ms per 9 x 9 board to build
+        r, c = np.where(sudoku != 0)
+        assumptions = self.bools[r, c, sudoku[r, c] - 1].tolist()
+        if fresh:
+            with Solver(name=self.sat.solver_name, bootstrap_with=base_clauses(self.n, self.encoding)) as solver:
+                found = solver.solve(assumptions=assumptions)
+                model = solver.get_model() if found else None
+                stats = solver.accum_stats()
+            conflicts, decisions = stats['conflicts'], stats['decisions']
+        else:
+            before = self.solver.accum_stats()
+            model = self.sat.solve(assumptions)
+            after = self.solver.accum_stats()
+            conflicts = after['conflicts'] - before['conflicts']
+            decisions = after['decisions'] - before['decisions']
+        grade = {'solution': None, 'unique': False, 'givens': len(r),
+                 'conflicts': conflicts, 'decisions': decisions}
+        if model is not None:
+            # a second model under the same givens means that it is not unique
+            grade['solution'] = format_solution(model, self.n)
+            free = self.bools[sudoku == 0].ravel().tolist()
+            self.sat.push()
+            self.sat.extend([[-model[v - 1] for v in free]])
+            grade['unique'] = self.sat.solve(assumptions) is None
+            self.sat.pop()
+        return grade
+
+
+_batch_solver = None
+
+
+def _init_batch_worker(n=9, propagate=False):
+    global _batch_solver
+    _batch_solver = SudokuSolver(n, propagate)
+
+
+def _solve_lines(lines):
+    return _batch_solver.solve_lines(lines)
+
+
+def _grade_lines(lines, fresh=False):
+    # every uniqueness check leaves a retired selector variable behind, so
+    # each chunk starts from a fresh solver
+    global _batch_solver
+    _batch_solver = SudokuSolver(_batch_solver.n, encoding=_batch_solver.encoding)
+    return _batch_solver.grade_lines(lines, fresh)
+
+
+def _chunks(lines, size):
+    # blank lines are kept, so that result i always belongs to line i
+    chunk = []
+    for line in lines:
+        chunk.append(line.strip())
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _run_batch(func, lines, processes, chunksize, propagate, n):
+    # yields the results in input order, every worker reuses one solver for
+    # all its puzzles
+    chunks = _chunks(lines, chunksize)
+    with worker_pool(processes, _init_batch_worker, (n, propagate)) as pool:
+        for results in pool.imap(func, chunks):
+            yield from results
+
+
+def solve_batch(lines, processes=None, chunksize=1000, propagate=False, n=9):
+    # None for unsolvable puzzles
+    return _run_batch(_solve_lines, lines, processes, chunksize, propagate, n)
+
+
+def grade_batch(lines, processes=None, chunksize=1000, n=9, fresh=False):
+    # by default every chunk is graded on one warm solver, so the effort of a
+    # puzzle depends on the puzzles before it in its chunk, fresh=True grades
+    # each puzzle on a new solver and the counts no longer depend on the
+    # order or the chunk size
+    return _run_batch(partial(_grade_lines, fresh=fresh), lines, processes, chunksize, False, n)
 
 
 
 class SudokuCanvas:
-    def __init__(self, size=400, margin=10, n=9, text_size=24):       
-        self.n = 9
+    # layers: cell highlights, the static grid, digits
+    HIGHLIGHT, GRID, DIGITS = range(3)
+
+    def __init__(self, size=400, margin=10, n=9, text_size=24):
+        self.n = n
+        self.box = int(round(n ** 0.5))
         self.size = size
         self.text_size = text_size
         self.margin = margin
-        self.canvas = Canvas(width=size, height=size)
+        self.canvas = MultiCanvas(3, width=size, height=size)
         self.step = (size - 2 * margin) // n
         self.w = self.step * n
 
         self.event = Event(source=self.canvas, watched_events=['keydown'])
         self.event.on_dom_event(self.handle_event)
-        
+
         self.x = 0
         self.y = 0
         self.board = [['0'] * self.n for _ in range(self.n)]
-        self.solver = SudokuSolver()
+        self.solver = SudokuSolver(n)
         self.solution = self.solver.solve(self.board)
+        # what is on the highlight and digit layers now, by cell
+        self.highlights = {}
+        self.digits = {}
+        self.draw_grid()
         self.draw()
-        
+
     def __setitem__(self, index, value):
         y, x = index
         self.board[y][x] = value
-        
+
     def __getitem__(self, index):
         y, x = index
         return self.board[y][x]
@@ -81,43 +375,142 @@ class SudokuCanvas:
             self.x = max(0, self.x - 1)
         elif key == 'ArrowRight':
             self.x = min(self.n - 1, self.x + 1)
-        elif '0' <= key <='9':
-            self[self.y, self.x] = key
-            self.solution = self.solver.solve(self.board)
-        self.draw() 
-        
+        elif len(key) == 1 and key.upper() in SYMBOLS[:self.n + 1]:
+            if self[self.y, self.x] == key.upper():
+                return
+            self[self.y, self.x] = key.upper()
+            solution = self.solver.solve(self.board)
+            # with an unchanged solution only the typed cell can change
+            cells = None if solution != self.solution else [(self.y, self.x)]
+            self.solution = solution
+            self.draw_highlights()
+            self.draw_digits(cells)
+            return
+        self.draw_highlights()
+
+    def cell_rect(self, y, x):
+        return self.margin + x * self.step, self.margin + y * self.step, self.step, self.step
+
+    def draw_grid(self):
+        canvas = self.canvas[self.GRID]
+        margin = self.margin
+        with ipycanvas.hold_canvas(canvas):
+            canvas.stroke_style = 'black'
+            for i, v in enumerate(range(margin, margin + self.w + 1, self.step)):
+                canvas.line_width = 3 if i % self.box == 0 else 1
+                canvas.stroke_line(margin, v, margin + self.w, v)
+                canvas.stroke_line(v, margin, v, margin + self.w)
+
     def draw(self):
-        canvas = self.canvas
+        self.draw_highlights()
+        self.draw_digits()
+
+    def draw_highlights(self):
+        highlights = {cell: '#ffcccc' for cell in self.solver.conflict}
+        highlights[self.y, self.x] = '#dddddd'
+        changed = [cell for cell in set(highlights) | set(self.highlights)
+                   if highlights.get(cell) != self.highlights.get(cell)]
+        if not changed:
+            return
+        canvas = self.canvas[self.HIGHLIGHT]
+        with ipycanvas.hold_canvas(canvas):
+            for cell in changed:
+                canvas.clear_rect(*self.cell_rect(*cell))
+                if cell in highlights:
+                    canvas.fill_style = highlights[cell]
+                    canvas.fill_rect(*self.cell_rect(*cell))
+        self.highlights = highlights
+
+    def draw_digits(self, cells=None):
+        if cells is None:
+            cells = [(i, j) for i in range(self.n) for j in range(self.n)]
+        changed = {}
+        for i, j in cells:
+            c = self[i, j]
+            if c != '0':
+                digit = c, 'black'
+            elif self.solution is not None:
+                digit = self.solution[i][j], '#bbbbbb'
+            else:
+                digit = None
+            if digit != self.digits.get((i, j)):
+                changed[i, j] = digit
+        if not changed:
+            return
+        self.digits.update(changed)
+
+        canvas = self.canvas[self.DIGITS]
+        step = self.step
         with ipycanvas.hold_canvas(canvas):
-            canvas.clear()
-            canvas.stroke_style = "black"
-            canvas.text_align = "center"
-            canvas.text_baseline = "middle"
+            if len(changed) * 2 > self.n * self.n:
+                # cheaper to clear the layer and repaint every digit
+                canvas.clear()
+                changed = self.digits
+            else:
+                for cell in changed:
+                    canvas.clear_rect(*self.cell_rect(*cell))
+            canvas.text_align = 'center'
+            canvas.text_baseline = 'middle'
             canvas.font = f'{self.text_size}px monospace'
-            margin = self.margin
-            size = self.size
-            step = self.step
-            w = self.w
-            canvas.fill_style = '#dddddd'
-            canvas.fill_rect(margin + self.x * step, margin + self.y * step, step, step)
-            canvas.fill_style = 'black'
-            for i, v in enumerate(range(margin, size - margin, step)):
-                if i % 3 == 0:
-                    canvas.line_width = 3
-                else:
-                    canvas.line_width = 1
-                canvas.stroke_line(margin, v, margin + w, v)
-                canvas.stroke_line(v, margin, v, margin + w)
-
-            for i in range(self.n):
-                for j in range(self.n):
-                    c = self[i, j]
-                    x = margin + j * step + step // 2
-                    y = margin + i * step + step // 2
-                    if c != '0':
-                        canvas.fill_style = "black"
-                        canvas.fill_text(c, x, y)
+            for color in ('black', '#bbbbbb'):
+                canvas.fill_style = color
+                for (i, j), digit in changed.items():
+                    if digit is not None and digit[1] == color:
+                        x, y, _, _ = self.cell_rect(i, j)
+                        canvas.fill_text(digit[0], x + step // 2, y + step // 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve a file of sudoku puzzles, one per line.')
+    parser.add_argument('input', help='puzzle file, one puzzle per line')
+    parser.add_argument('-n', '--size', type=int, default=9,
+                        help='side length, 9, 16 or 25, larger boards use the letters A-P')
+    parser.add_argument('-o', '--output', help='solution file, stdout by default')
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=1000)
+    parser.add_argument('--propagate', action='store_true',
+                        help='propagate naked and hidden singles before the SAT solver')
+    parser.add_argument('--grade', action='store_true',
+                        help='write "solution unique givens conflicts decisions" per puzzle')
+    parser.add_argument('--reproducible', action='store_true',
+                        help='grade every puzzle on a new solver, slower but independent of the order')
+    args = parser.parse_args(argv)
+
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+    start = time.perf_counter()
+    count = malformed = 0
+
+    def checked(lines):
+        nonlocal malformed
+        for line in lines:
+            malformed += not valid_line(line, args.size)
+            yield line
+
+    try:
+        with open(args.input) as f:
+            # one output line per input line
+            if args.grade:
+                for grade in grade_batch(checked(f), args.processes, args.chunksize, args.size,
+                                         args.reproducible):
+                    if grade is None:
+                        output.write('-\n')
                     else:
-                        c = self.solution[i][j]
-                        canvas.fill_style = "#bbbbbb"
-                        canvas.fill_text(c, x, y)
\ No newline at end of file
+                        output.write('{} {:d} {} {} {}\n'.format(
+                            grade['solution'] or '-', grade['unique'], grade['givens'],
+                            grade['conflicts'], grade['decisions']))
+                    count += 1
+            else:
+                for solution in solve_batch(checked(f), args.processes, args.chunksize, args.propagate, args.size):
+                    # unsolvable and malformed puzzles are written as empty lines
+                    output.write((solution or '') + '\n')
+                    count += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print(f'{count} puzzles in {elapsed:.2f}s, {count / elapsed:.0f} puzzles/s, {malformed} malformed',
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()